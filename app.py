@@ -2,21 +2,23 @@
 Yaman Hybrid Workshop Management System - Consolidated Backend
 This is a consolidated FastAPI application for running on Replit with PostgreSQL
 """
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import List, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func, text
+from sqlalchemy import func, select, text
 import bcrypt
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 import os
 from pathlib import Path
 
-from database import get_db, SessionLocal
+from database import (
+    ReadYourWritesMiddleware, engine, get_branch_id, get_db, get_read_db, read_router, shard_router, SessionLocal
+)
 from models import (
     User as UserModel,
     Service as ServiceModel,
@@ -28,17 +30,42 @@ from models import (
     InspectionPhoto as InspectionPhotoModel,
     UserRole,
     UserStatus,
-    WorkOrderStatus
+    WorkOrderStatus,
+    INSPECTION_STATUSES,
+    archived_work_orders
 )
+from bulk_import import IMPORT_KINDS, BulkImportError, import_file
 from file_utils import save_inspection_photo
+from compression import CompressionMiddleware
+from conditional import (
+    Validators, collection_validators, conditional_response, resource_validators, rows_validators, weak_etag,
+)
+from delta_sync import (
+    SYNC_MAX_PAGE_SIZE,
+    SYNC_PAGE_SIZE,
+    SyncMutationBatch,
+    SyncMutationResult,
+    apply_mutations,
+    fetch_changes,
+)
+from serializers import FastJSONResponse, columns_for, trusted_response
+from shared.audit import ThreadedAuditWriter
+from shared.branches import TOKEN_ALGORITHM, TOKEN_BRANCH_CLAIM, TOKEN_SECRET_KEY
+from shared.catalog import SyncCatalogCache
+from shared.idempotency import IdempotencyMiddleware, SyncIdempotencyStore
+from shared.instrumentation import instrument_app, instrument_engine
+from shared.numbering import INSPECTION, SHARD_INDEX_SQL, SyncNumberAllocator, check_shard_indexes
 from fastapi import File, UploadFile
 
 app = FastAPI(
     title="Yaman Workshop Management System",
     description="نظام إدارة ورش يمن الهجين - Workshop Management System",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
+# Innermost: replays go back out through CORS and compression like fresh responses
+app.add_middleware(IdempotencyMiddleware, store=SyncIdempotencyStore(engine), service="app")
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -46,9 +73,47 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+
+instrument_app(app, "app", engine=engine)
+for replica in read_router.replicas:
+    instrument_engine(replica.engine, "app")
+for shard_engine in shard_router.engines.values():
+    if shard_engine is not engine:
+        instrument_engine(shard_engine, "app")
+document_numbers = SyncNumberAllocator(engine)
+audit = ThreadedAuditWriter(engine)
+catalog = SyncCatalogCache(engine)
+
+
+@app.on_event("startup")
+def check_number_ranges():
+    # Trigger-assigned numbers on other shards must stay out of document_numbers' range
+    check_shard_indexes(shard_router.scatter_gather(lambda db: db.execute(text(SHARD_INDEX_SQL)).scalar_one()))
+
+
+@app.on_event("startup")
+def start_audit_writer():
+    audit.start()
+
 
-SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
-ALGORITHM = "HS256"
+@app.on_event("startup")
+def start_catalog_cache():
+    catalog.start()
+
+
+@app.on_event("shutdown")
+def stop_audit_writer():
+    audit.stop()
+
+
+@app.on_event("shutdown")
+def stop_catalog_cache():
+    catalog.stop()
+
+SECRET_KEY = TOKEN_SECRET_KEY
+ALGORITHM = TOKEN_ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 
@@ -95,6 +160,15 @@ class WorkOrderResponse(BaseModel):
         from_attributes = True
 
 
+class BranchStats(BaseModel):
+    branch_id: int
+    shard: str
+    total_customers: int
+    total_work_orders: int
+    active_work_orders: int
+    completed_today: int
+
+
 class DashboardStats(BaseModel):
     total_customers: int
     total_work_orders: int
@@ -318,26 +392,46 @@ async def health_check(db: Session = Depends(get_db)):
         "service": "yaman_workshop_system",
         "version": "1.0.0",
         "database": db_status,
+        "replicas": read_router.status(),
         "users_in_db": user_count
     }
 
 
+def find_login_user(username: str, password: str) -> Optional[UserModel]:
+    """The user with these credentials on any shard; looked up unscoped, before a branch is known."""
+    found = shard_router.scatter_gather(
+        lambda db: db.query(UserModel).filter(UserModel.username == username).all()
+    )
+    for users in found.values():
+        for user in users:
+            if verify_password(password, user.hashed_password):
+                return user
+    return None
+
+
 @app.post("/api/v1/auth/login")
-async def login(credentials: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(UserModel).filter(UserModel.username == credentials.username).first()
+async def login(credentials: LoginRequest):
+    user = find_login_user(credentials.username, credentials.password)
     
-    if not user or not verify_password(credentials.password, user.hashed_password):
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     if not user.is_active:
         raise HTTPException(status_code=403, detail="User account is inactive")
     
-    user.last_login = datetime.utcnow()
-    db.commit()
+    db = shard_router.session(user.branch_id)
+    try:
+        db.query(UserModel).filter(UserModel.id == user.id).update(
+            {UserModel.last_login: datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
     
+    # The branch claim scopes every later request (database.get_branch_id)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = jwt.encode(
-        {"sub": user.username, "exp": datetime.utcnow() + access_token_expires},
+        {"sub": user.username, TOKEN_BRANCH_CLAIM: user.branch_id, "exp": datetime.utcnow() + access_token_expires},
         SECRET_KEY,
         algorithm=ALGORITHM
     )
@@ -350,81 +444,168 @@ async def login(credentials: LoginRequest, db: Session = Depends(get_db)):
             "username": user.username,
             "email": user.email,
             "role": user.role,
-            "full_name": user.full_name
+            "full_name": user.full_name,
+            "branch_id": user.branch_id
         }
     }
 
 
 @app.get("/api/v1/users", response_model=List[UserResponse])
-async def get_users(db: Session = Depends(get_db)):
-    users = db.query(UserModel).filter(UserModel.is_active == True).all()
-    return users
+async def get_users(request: Request, db: Session = Depends(get_read_db)):
+    users = db.query(*columns_for(UserResponse, UserModel)).filter(UserModel.is_active == True)
+    return conditional_response(
+        request,
+        collection_validators(users, UserModel.updated_at, UserResponse),
+        lambda: trusted_response(UserResponse, users.all())
+    )
 
 
 @app.get("/api/v1/users/{user_id}", response_model=UserResponse)
-async def get_user(user_id: int, db: Session = Depends(get_db)):
+async def get_user(user_id: int, request: Request, db: Session = Depends(get_db)):
     user = db.query(UserModel).filter(UserModel.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return conditional_response(
+        request, resource_validators(user, UserResponse), lambda: trusted_response(UserResponse, user)
+    )
 
 
 @app.get("/api/v1/customers", response_model=List[UserResponse])
-async def get_customers(db: Session = Depends(get_db)):
-    customers = db.query(UserModel).filter(
+async def get_customers(request: Request, db: Session = Depends(get_read_db)):
+    customers = db.query(*columns_for(UserResponse, UserModel)).filter(
         UserModel.role == 'Customer',
         UserModel.is_active == True
-    ).all()
-    return customers
+    )
+    return conditional_response(
+        request,
+        collection_validators(customers, UserModel.updated_at, UserResponse),
+        lambda: trusted_response(UserResponse, customers.all())
+    )
 
 
 @app.get("/api/v1/customers/{customer_id}", response_model=UserResponse)
-async def get_customer(customer_id: int, db: Session = Depends(get_db)):
+async def get_customer(customer_id: int, request: Request, db: Session = Depends(get_db)):
     customer = db.query(UserModel).filter(
         UserModel.id == customer_id,
         UserModel.role == 'Customer'
     ).first()
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
-    return customer
+    return conditional_response(
+        request, resource_validators(customer, UserResponse), lambda: trusted_response(UserResponse, customer)
+    )
 
 
 @app.get("/api/v1/services", response_model=List[ServiceResponse])
-async def get_services(db: Session = Depends(get_db)):
-    services = db.query(ServiceModel).filter(ServiceModel.status == 'Available').all()
-    return services
+async def get_services(request: Request, db: Session = Depends(get_read_db)):
+    if catalog.ready:
+        available = catalog.snapshot.available()
+        return conditional_response(
+            request, rows_validators(available, ServiceResponse), lambda: trusted_response(ServiceResponse, available)
+        )
+    services = db.query(*columns_for(ServiceResponse, ServiceModel)).filter(ServiceModel.status == 'Available')
+    return conditional_response(
+        request,
+        collection_validators(services, ServiceModel.updated_at, ServiceResponse),
+        lambda: trusted_response(ServiceResponse, services.all())
+    )
 
 
 @app.get("/api/v1/services/{service_id}", response_model=ServiceResponse)
-async def get_service(service_id: int, db: Session = Depends(get_db)):
-    service = db.query(ServiceModel).filter(ServiceModel.id == service_id).first()
+async def get_service(service_id: int, request: Request, db: Session = Depends(get_db)):
+    if catalog.ready:
+        service = catalog.snapshot.service(service_id)
+    else:
+        service = db.query(ServiceModel).filter(ServiceModel.id == service_id).first()
     if not service:
         raise HTTPException(status_code=404, detail="Service not found")
-    return service
+    return conditional_response(
+        request, resource_validators(service, ServiceResponse), lambda: trusted_response(ServiceResponse, service)
+    )
+
+
+@app.get("/api/v1/services/{service_id}/price")
+async def get_service_price(service_id: int, quantity: int = Query(1, ge=1)):
+    """Unit and total price for a quantity, from the service's active pricing tiers"""
+    if not catalog.ready:
+        raise HTTPException(status_code=503, detail="Service catalog is loading", headers={"Retry-After": "5"})
+    service = catalog.snapshot.service(service_id)
+    if not service:
+        raise HTTPException(status_code=404, detail="Service not found")
+    unit_price, tier = service.unit_price(quantity)
+    return {
+        "service_id": service.id,
+        "quantity": quantity,
+        "unit_price": unit_price,
+        "total_price": unit_price * quantity,
+        "currency": tier.currency if tier else service.currency,
+        "tier": tier.name if tier else None,
+        "tier_ar": tier.name_ar if tier else None,
+    }
+
+
+@app.get("/api/v1/catalog")
+async def get_catalog(request: Request):
+    """Active categories with their available services, pricing tiers and specifications"""
+    if not catalog.ready:
+        raise HTTPException(status_code=503, detail="Service catalog is loading", headers={"Retry-After": "5"})
+    snapshot = catalog.snapshot
+
+    def render():
+        return FastJSONResponse([
+            {
+                "id": category.id, "name": category.name, "name_ar": category.name_ar,
+                "services": [
+                    {
+                        "id": service.id, "service_code": service.service_code,
+                        "name": service.name, "name_ar": service.name_ar,
+                        "base_price": service.base_price, "currency": service.currency,
+                        "estimated_duration": service.estimated_duration, "is_featured": service.is_featured,
+                        "tags": service.tags,
+                        "pricing": [tier._asdict() for tier in service.tiers],
+                        "specifications": [spec._asdict() for spec in service.specs],
+                    }
+                    for service in category.services if service.status == "Available"
+                ],
+            }
+            for category in snapshot.categories if category.is_active
+        ])
+
+    return conditional_response(request, Validators(weak_etag("catalog", snapshot.version)), render)
 
 
 @app.get("/api/v1/work-orders", response_model=List[WorkOrderResponse])
-async def get_work_orders(db: Session = Depends(get_db)):
-    work_orders = db.query(WorkOrderModel).order_by(WorkOrderModel.created_at.desc()).all()
-    return work_orders
+async def get_work_orders(request: Request, db: Session = Depends(get_read_db)):
+    work_orders = db.query(*columns_for(WorkOrderResponse, WorkOrderModel))
+    return conditional_response(
+        request,
+        collection_validators(work_orders, WorkOrderModel.updated_at, WorkOrderResponse),
+        lambda: trusted_response(WorkOrderResponse, work_orders.order_by(WorkOrderModel.created_at.desc()).all())
+    )
 
 
 @app.get("/api/v1/work-orders/{work_order_id}", response_model=WorkOrderResponse)
-async def get_work_order(work_order_id: int, db: Session = Depends(get_db)):
+async def get_work_order(work_order_id: int, request: Request, db: Session = Depends(get_db)):
     work_order = db.query(WorkOrderModel).filter(WorkOrderModel.id == work_order_id).first()
+    if not work_order:
+        # Closed work orders older than a year are moved to the archive schema by shared.archiver
+        columns = [archived_work_orders.c[name] for name in (*WorkOrderResponse.model_fields, "updated_at")]
+        work_order = db.execute(select(*columns).where(
+            archived_work_orders.c.id == work_order_id,
+            archived_work_orders.c.branch_id == db.info["branch_id"]
+        )).first()
     if not work_order:
         raise HTTPException(status_code=404, detail="Work order not found")
-    return work_order
+    return conditional_response(
+        request,
+        resource_validators(work_order, WorkOrderResponse),
+        lambda: trusted_response(WorkOrderResponse, work_order)
+    )
 
 
 @app.post("/api/v1/inspections", response_model=InspectionResponse)
 async def create_inspection(inspection_data: InspectionCreate, db: Session = Depends(get_db)):
-    from datetime import datetime as dt
-    import uuid
-    
-    timestamp = dt.now().strftime('%Y%m%d%H%M%S')
-    unique_id = str(uuid.uuid4())[:8]
-    inspection_number = f"INS-{timestamp}-{unique_id}"
+    inspection_number = document_numbers.next(INSPECTION)
     
     new_inspection = InspectionModel(
         inspection_number=inspection_number,
@@ -446,33 +627,43 @@ async def create_inspection(inspection_data: InspectionCreate, db: Session = Dep
     db.add(new_inspection)
     db.commit()
     db.refresh(new_inspection)
+    audit.record("inspections", "INSERT", new_inspection.id,
+                 new_values={"inspection_number": inspection_number, "customer_id": inspection_data.customer_id})
     
     return new_inspection
 
 
 @app.get("/api/v1/inspections", response_model=List[InspectionResponse])
 async def get_inspections(
+    request: Request,
     status: Optional[str] = None,
     customer_id: Optional[int] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    query = db.query(InspectionModel)
+    query = db.query(*columns_for(InspectionResponse, InspectionModel))
     
     if status:
         query = query.filter(InspectionModel.status == status)
     if customer_id:
         query = query.filter(InspectionModel.customer_id == customer_id)
     
-    inspections = query.order_by(InspectionModel.created_at.desc()).all()
-    return inspections
+    return conditional_response(
+        request,
+        collection_validators(query, InspectionModel.updated_at, InspectionResponse),
+        lambda: trusted_response(InspectionResponse, query.order_by(InspectionModel.created_at.desc()).all())
+    )
 
 
 @app.get("/api/v1/inspections/{inspection_id}", response_model=InspectionDetailResponse)
-async def get_inspection(inspection_id: int, db: Session = Depends(get_db)):
+async def get_inspection(inspection_id: int, request: Request, db: Session = Depends(get_db)):
     inspection = db.query(InspectionModel).filter(InspectionModel.id == inspection_id).first()
     if not inspection:
         raise HTTPException(status_code=404, detail="Inspection not found")
-    return inspection
+    return conditional_response(
+        request,
+        resource_validators(inspection, InspectionDetailResponse),
+        lambda: trusted_response(InspectionDetailResponse, inspection)
+    )
 
 
 @app.put("/api/v1/inspections/{inspection_id}/status")
@@ -481,24 +672,25 @@ async def update_inspection_status(
     status_update: InspectionStatusUpdate,
     db: Session = Depends(get_db)
 ):
-    ALLOWED_STATUSES = ["Draft", "Pending", "In_Progress", "Completed", "Approved", "Rejected"]
-    
-    if status_update.status not in ALLOWED_STATUSES:
+    if status_update.status not in INSPECTION_STATUSES:
         raise HTTPException(
             status_code=400, 
-            detail=f"Invalid status. Allowed values: {', '.join(ALLOWED_STATUSES)}"
+            detail=f"Invalid status. Allowed values: {', '.join(INSPECTION_STATUSES)}"
         )
     
     inspection = db.query(InspectionModel).filter(InspectionModel.id == inspection_id).first()
     if not inspection:
         raise HTTPException(status_code=404, detail="Inspection not found")
     
+    old_status = inspection.status
     inspection.status = status_update.status
     if status_update.notes:
         inspection.notes = status_update.notes
     
     db.commit()
     db.refresh(inspection)
+    audit.record("inspections", "UPDATE", inspection_id,
+                 old_values={"status": old_status}, new_values={"status": status_update.status})
     
     return {"message": "Status updated successfully", "inspection_id": inspection_id, "new_status": status_update.status}
 
@@ -585,8 +777,32 @@ async def get_inspection_photos(inspection_id: int, db: Session = Depends(get_db
     return photos
 
 
+@app.get("/api/v1/sync/changes")
+async def get_sync_changes(
+    cursor: Optional[str] = None,
+    limit: int = Query(SYNC_PAGE_SIZE, ge=1, le=SYNC_MAX_PAGE_SIZE),
+    db: Session = Depends(get_db)
+):
+    """Rows changed and deleted since the app's cursor, in compact batches (see delta_sync.py)"""
+    try:
+        return FastJSONResponse(fetch_changes(db, cursor, limit))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/api/v1/sync/mutations", response_model=List[SyncMutationResult])
+async def post_sync_mutations(batch: SyncMutationBatch, db: Session = Depends(get_db)):
+    """Offline edits from the app; idempotent per key, conflicts return the server version"""
+    def record(table, mutation, result):
+        operation = {"create": "INSERT", "update": "UPDATE", "delete": "DELETE"}[mutation.op]
+        audit.record(table.name, operation, result["id"], new_values=mutation.values or None,
+                     user_agent=f"sync:{batch.device_id}")
+
+    return FastJSONResponse(apply_mutations(db, batch, on_applied=record))
+
+
 @app.get("/api/v1/dashboard/stats", response_model=DashboardStats)
-async def get_dashboard_stats(db: Session = Depends(get_db)):
+async def get_dashboard_stats(db: Session = Depends(get_read_db)):
     total_customers = db.query(UserModel).filter(UserModel.role == 'Customer').count()
     total_work_orders = db.query(WorkOrderModel).count()
     total_services = db.query(ServiceModel).count()
@@ -610,7 +826,7 @@ async def get_dashboard_stats(db: Session = Depends(get_db)):
 
 
 @app.get("/api/v1/reports/summary")
-async def get_reports_summary(db: Session = Depends(get_db)):
+async def get_reports_summary(db: Session = Depends(get_read_db)):
     top_services = db.query(ServiceModel).filter(
         ServiceModel.is_featured == True
     ).limit(3).all()
@@ -634,6 +850,62 @@ async def get_reports_summary(db: Session = Depends(get_db)):
     }
 
 
+@app.get("/api/v1/reports/branches", response_model=List[BranchStats])
+async def get_branch_report():
+    """Dashboard counts for every branch, gathered from all shards in parallel"""
+    today = datetime.utcnow().date()
+
+    def shard_counts(db: Session):
+        customers = dict(db.query(UserModel.branch_id, func.count()).filter(
+            UserModel.role == 'Customer'
+        ).group_by(UserModel.branch_id).all())
+        work_orders = db.query(
+            WorkOrderModel.branch_id,
+            func.count(),
+            func.count().filter(WorkOrderModel.status == 'In_Progress'),
+            func.count().filter(
+                WorkOrderModel.status == 'Completed', func.date(WorkOrderModel.completed_at) == today
+            )
+        ).group_by(WorkOrderModel.branch_id).all()
+        return customers, work_orders
+
+    report = []
+    for shard, (customers, work_orders) in shard_router.scatter_gather(shard_counts).items():
+        by_branch = {branch_id: (total, active, completed) for branch_id, total, active, completed in work_orders}
+        for branch_id in sorted(set(customers) | set(by_branch)):
+            total, active, completed = by_branch.get(branch_id, (0, 0, 0))
+            report.append({
+                "branch_id": branch_id,
+                "shard": shard,
+                "total_customers": customers.get(branch_id, 0),
+                "total_work_orders": total,
+                "active_work_orders": active,
+                "completed_today": completed
+            })
+    return sorted(report, key=lambda row: row["branch_id"])
+
+
+@app.post("/api/v1/imports/{kind}")
+def bulk_import_file(kind: str, file: UploadFile = File(...), dry_run: bool = False,
+                     branch_id: int = Depends(get_branch_id)):
+    """Upsert services, vehicle types or customers from a CSV, XLSX or JSONL file (see bulk_import.py)"""
+    target = IMPORT_KINDS.get(kind)
+    if target is None:
+        raise HTTPException(status_code=404, detail=f"Unknown import; expected one of {', '.join(IMPORT_KINDS)}")
+    # Plain def: runs in the threadpool, the import holds a connection for its whole load step
+    try:
+        report = import_file(shard_router.engine_for(branch_id) if target.shard_by_branch else engine,
+                             kind, file.file, file.filename or "", branch_id, dry_run)
+    except BulkImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not dry_run:
+        audit.record("bulk_imports", "INSERT", new_values={
+            "kind": kind, "file": file.filename, "branch_id": branch_id,
+            **{key: report[key] for key in ("rows", "inserted", "updated", "failed")},
+        })
+    return report
+
+
 @app.post("/api/v1/ai/ask")
 async def ai_chatbot_ask(question: dict):
     return {
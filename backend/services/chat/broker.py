@@ -0,0 +1,82 @@
+"""
+Cross-worker event delivery for the chat service - توزيع أحداث الدردشة بين العمليات
+
+Every worker fans events out to its own sockets directly; the broker only has
+to carry them to the *other* workers. Two implementations share one interface:
+
+- LocalBroker: single-process deployments and development, nothing leaves the process.
+- PostgresBroker: LISTEN/NOTIFY on the existing database. NOTIFY is transactional,
+  so publishing on the connection that inserted the message delivers it only after
+  commit. Payloads above the NOTIFY limit are sent as a reference and the receiving
+  worker loads the message itself.
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import json
+import uuid
+
+import asyncpg
+
+EventHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+NOTIFY_CHANNEL = "chat_events"
+MAX_NOTIFY_PAYLOAD = 7500  # Postgres rejects payloads of 8000 bytes or more
+
+
+def dumps(event: Dict[str, Any]) -> str:
+    return json.dumps(event, default=str, ensure_ascii=False, separators=(",", ":"))
+
+
+class LocalBroker:
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex
+        self.handler: Optional[EventHandler] = None
+
+    async def start(self, handler: EventHandler):
+        self.handler = handler
+
+    async def publish(self, event: Dict[str, Any], conn=None):
+        # Local subscribers were already served by the caller
+        return None
+
+    async def stop(self):
+        self.handler = None
+
+
+class PostgresBroker(LocalBroker):
+    def __init__(self, db_url: str, channel: str = NOTIFY_CHANNEL):
+        super().__init__()
+        self.db_url = db_url
+        self.channel = channel
+        self.listen_conn: Optional[asyncpg.Connection] = None
+
+    async def start(self, handler: EventHandler):
+        await super().start(handler)
+        self.listen_conn = await asyncpg.connect(self.db_url)
+        await self.listen_conn.add_listener(self.channel, self._on_notify)
+
+    async def publish(self, event: Dict[str, Any], conn=None):
+        payload = dumps({**event, "worker": self.worker_id})
+        if len(payload.encode("utf-8")) > MAX_NOTIFY_PAYLOAD:
+            if event.get("type") != "message":
+                return None
+            payload = dumps({
+                "type": "message_ref",
+                "room_id": event["room_id"],
+                "message_id": event["message"]["id"],
+                "worker": self.worker_id,
+            })
+        await conn.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        event = json.loads(payload)
+        if event.get("worker") == self.worker_id or self.handler is None:
+            return
+        asyncio.get_running_loop().create_task(self.handler(event))
+
+    async def stop(self):
+        if self.listen_conn is not None:
+            await self.listen_conn.remove_listener(self.channel, self._on_notify)
+            await self.listen_conn.close()
+            self.listen_conn = None
+        await super().stop()
@@ -0,0 +1,110 @@
+"""
+WebSocket connection registry for the chat service - إدارة اتصالات الدردشة
+
+Each room keeps the set of sockets subscribed to it. A new message is
+serialized once and offered to every subscriber's bounded outbound queue;
+a dedicated writer task per socket drains that queue. A consumer whose queue
+is full is reported back to the caller and disconnected instead of slowing
+down the rest of the room.
+
+Presence is counted per (room, user) so several tabs or devices of the same
+user only produce one online/offline transition. Counts also include sockets
+held by other workers, reported through the broker.
+"""
+from typing import Dict, Set, List, Optional
+import asyncio
+
+from fastapi import WebSocket
+
+DEFAULT_QUEUE_SIZE = 256
+
+
+class ClientConnection:
+    def __init__(self, websocket: WebSocket, room_id: int, user_id: int, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.websocket = websocket
+        self.room_id = room_id
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+
+    def offer(self, payload: str) -> bool:
+        """Queue a frame without waiting; False means the consumer is too slow."""
+        if self.closed:
+            return True
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def writer(self):
+        while True:
+            payload = await self.queue.get()
+            if payload is None:
+                return
+            await self.websocket.send_text(payload)
+
+    def stop(self):
+        self.closed = True
+        # Wake the writer even when the queue is full of undeliverable frames
+        while True:
+            try:
+                self.queue.put_nowait(None)
+                return
+            except asyncio.QueueFull:
+                self.queue.get_nowait()
+
+
+class ConnectionManager:
+    def __init__(self, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.rooms: Dict[int, Set[ClientConnection]] = {}
+        self.presence: Dict[int, Dict[int, int]] = {}  # room_id -> user_id -> open sockets on all workers
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self.rooms.values())
+
+    def register(self, websocket: WebSocket, room_id: int, user_id: int) -> ClientConnection:
+        connection = ClientConnection(websocket, room_id, user_id, self.queue_size)
+        self.rooms.setdefault(room_id, set()).add(connection)
+        return connection
+
+    def unregister(self, connection: ClientConnection):
+        connection.stop()
+        subscribers = self.rooms.get(connection.room_id)
+        if subscribers is None:
+            return
+        subscribers.discard(connection)
+        if not subscribers:
+            del self.rooms[connection.room_id]
+
+    def adjust_presence(self, room_id: int, user_id: int, delta: int) -> Optional[str]:
+        """Apply a socket count change; returns 'online'/'offline' when the user's state flips."""
+        users = self.presence.setdefault(room_id, {})
+        before = users.get(user_id, 0)
+        after = max(before + delta, 0)
+        if after:
+            users[user_id] = after
+        else:
+            users.pop(user_id, None)
+            if not users:
+                del self.presence[room_id]
+        if before == 0 and after > 0:
+            return "online"
+        if before > 0 and after == 0:
+            return "offline"
+        return None
+
+    def online_users(self, room_id: int) -> List[int]:
+        return sorted(self.presence.get(room_id, {}))
+
+    def broadcast(self, room_id: int, payload: str, exclude: Optional[ClientConnection] = None) -> List[ClientConnection]:
+        """Fan a serialized frame out to the room; returns subscribers whose queue overflowed."""
+        slow = []
+        for connection in self.rooms.get(room_id, ()):
+            if connection is exclude:
+                continue
+            if not connection.offer(payload):
+                slow.append(connection)
+        return slow
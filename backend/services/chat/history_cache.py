@@ -0,0 +1,133 @@
+"""
+Recent-messages cache for chat rooms - ذاكرة مؤقتة لأحدث رسائل الغرف
+
+Keeps a ring buffer of the newest messages of each recently used room,
+ordered by (created_at, id) like the history index. The send path and broker
+events append to it, so a busy room's first page (and short scroll-backs) are
+served without touching the database. Rooms are evicted least recently used.
+
+A buffer is always a contiguous suffix of the room's history: it either holds
+``capacity`` messages, or ``complete`` is set because the database had nothing
+older when it was loaded.
+"""
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from datetime import datetime
+
+DEFAULT_CAPACITY = 200
+DEFAULT_MAX_ROOMS = 5000
+
+
+def sort_key(message: Dict[str, Any]) -> Tuple[datetime, int]:
+    return message['created_at'], message['id']
+
+
+class RoomBuffer:
+    __slots__ = ("messages", "complete")
+
+    def __init__(self, capacity: int):
+        self.messages: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+        self.complete = False
+
+
+class RecentMessageCache:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, max_rooms: int = DEFAULT_MAX_ROOMS):
+        self.capacity = capacity
+        self.max_rooms = max_rooms
+        self.rooms: "OrderedDict[int, RoomBuffer]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _touch(self, room_id: int) -> Optional[RoomBuffer]:
+        buffer = self.rooms.get(room_id)
+        if buffer is not None:
+            self.rooms.move_to_end(room_id)
+        return buffer
+
+    def _new_buffer(self, room_id: int) -> RoomBuffer:
+        buffer = RoomBuffer(self.capacity)
+        self.rooms[room_id] = buffer
+        while len(self.rooms) > self.max_rooms:
+            self.rooms.popitem(last=False)
+        return buffer
+
+    def add(self, room_id: int, message: Dict[str, Any]):
+        """Record a newly sent message; keeps the buffer ordered even if workers commit out of order."""
+        buffer = self._touch(room_id) or self._new_buffer(room_id)
+        messages = buffer.messages
+        key = sort_key(message)
+        if not messages or sort_key(messages[-1]) < key:
+            if len(messages) == messages.maxlen:
+                buffer.complete = False
+            messages.append(message)
+            return
+        if any(m['id'] == message['id'] for m in messages):
+            return
+        position = len(messages)
+        while position > 0 and sort_key(messages[position - 1]) > key:
+            position -= 1
+        if position == 0 and not buffer.complete:
+            return  # older than anything we hold; the database has it
+        if len(messages) == messages.maxlen:
+            messages.popleft()
+            buffer.complete = False
+            position -= 1
+        messages.insert(position, message)
+
+    def fill(self, room_id: int, newest_first: List[Dict[str, Any]], complete: bool):
+        """Warm a room from a database read of its newest messages."""
+        buffer = self._touch(room_id) or self._new_buffer(room_id)
+        loaded = {m['id'] for m in newest_first}
+        pending = [m for m in buffer.messages if m['id'] not in loaded]
+        buffer.messages.clear()
+        buffer.messages.extend(reversed(newest_first))
+        buffer.complete = complete
+        # Messages sent while the read was in flight
+        for message in pending:
+            self.add(room_id, message)
+
+    def page(
+        self,
+        room_id: int,
+        limit: int,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None
+    ) -> Optional[Tuple[List[Dict[str, Any]], bool]]:
+        """Newest-first page and has_more flag, or None when the cache cannot answer exactly."""
+        buffer = self._touch(room_id)
+        if buffer is None:
+            self.misses += 1
+            return None
+        messages = list(buffer.messages)
+
+        if after_id is not None:
+            index = next((i for i, m in enumerate(messages) if m['id'] == after_id), None)
+            if index is None:
+                self.misses += 1
+                return None
+            newer = messages[index + 1:index + 1 + limit]
+            self.hits += 1
+            return list(reversed(newer)), index + 1 + limit < len(messages)
+
+        end = len(messages)
+        if before_id is not None:
+            end = next((i for i, m in enumerate(messages) if m['id'] == before_id), None)
+            if end is None:
+                self.misses += 1
+                return None
+        start = end - limit
+        if start < 0 and not buffer.complete:
+            self.misses += 1
+            return None
+        self.hits += 1
+        has_more = start > 0 or (start == 0 and not buffer.complete)
+        return list(reversed(messages[max(start, 0):end])), has_more
+
+    def find(self, room_id: int, message_id: int) -> Optional[Dict[str, Any]]:
+        buffer = self.rooms.get(room_id)
+        if buffer is None:
+            return None
+        return next((m for m in reversed(buffer.messages) if m['id'] == message_id), None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"rooms": len(self.rooms), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,124 @@
+"""
+Chat gateway load test - اختبار تحميل بوابة الدردشة
+
+Opens many concurrent sockets spread over a set of rooms, has a fraction of
+them send messages at a fixed rate, and reports fan-out latency percentiles
+measured from the send timestamp embedded in each message.
+
+The users and rooms must exist: every user id in [--first-user, --first-user + --sockets)
+has to be an active participant of the room it is assigned to (user i joins
+room --first-room + i % --rooms).
+
+Usage:
+    ulimit -n 20000
+    python loadtest.py --url ws://localhost:8004 --sockets 5000 --rooms 250 --duration 60
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import websockets
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.sent = 0
+        self.received = 0
+        self.connected = 0
+        self.failed = 0
+        self.dropped = 0
+
+
+async def client(args, index: int, stats: Stats, start: asyncio.Event, stop: asyncio.Event,
+                 connect_slots: asyncio.Semaphore):
+    user_id = args.first_user + index
+    room_id = args.first_room + index % args.rooms
+    url = f"{args.url}/ws/rooms/{room_id}?user_id={user_id}"
+    try:
+        async with connect_slots:
+            ws = await websockets.connect(url, open_timeout=30, max_queue=None)
+    except Exception:
+        stats.failed += 1
+        return
+    stats.connected += 1
+
+    async def reader():
+        async for raw in ws:
+            event = json.loads(raw)
+            if event.get("type") != "message":
+                continue
+            stats.received += 1
+            metadata = event["message"].get("message_text") or ""
+            if metadata.startswith("lt:"):
+                stats.latencies.append(time.perf_counter() - float(metadata[3:]))
+
+    read_task = asyncio.create_task(reader())
+    await start.wait()
+    try:
+        sender = index % args.sender_every == 0
+        while not stop.is_set():
+            if sender:
+                await ws.send(json.dumps({"type": "message", "message_text": f"lt:{time.perf_counter()}"}))
+                stats.sent += 1
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=args.interval)
+            except asyncio.TimeoutError:
+                pass
+    except websockets.ConnectionClosed as e:
+        if e.rcvd and e.rcvd.code == 1013:
+            stats.dropped += 1
+    finally:
+        read_task.cancel()
+        await ws.close()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def main(args):
+    stats = Stats()
+    start, stop = asyncio.Event(), asyncio.Event()
+    connect_slots = asyncio.Semaphore(args.connect_concurrency)
+
+    tasks = [asyncio.create_task(client(args, i, stats, start, stop, connect_slots)) for i in range(args.sockets)]
+    while stats.connected + stats.failed < args.sockets:
+        await asyncio.sleep(0.5)
+        print(f"connecting... {stats.connected} open, {stats.failed} failed", end="\r")
+    print(f"\n{stats.connected} sockets open, {stats.failed} failed")
+
+    started = time.perf_counter()
+    start.set()
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+
+    latencies_ms = [l * 1000 for l in stats.latencies]
+    print(f"sent {stats.sent} messages, {stats.received} deliveries in {elapsed:.1f}s "
+          f"({stats.received / elapsed:.0f} deliveries/s)")
+    print(f"slow consumers dropped: {stats.dropped}")
+    if latencies_ms:
+        print(f"fan-out latency ms: p50={percentile(latencies_ms, 50):.1f} "
+              f"p95={percentile(latencies_ms, 95):.1f} p99={percentile(latencies_ms, 99):.1f} "
+              f"max={max(latencies_ms):.1f} mean={statistics.mean(latencies_ms):.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chat WebSocket load test")
+    parser.add_argument("--url", default="ws://localhost:8004")
+    parser.add_argument("--sockets", type=int, default=5000)
+    parser.add_argument("--rooms", type=int, default=250)
+    parser.add_argument("--first-user", type=int, default=1)
+    parser.add_argument("--first-room", type=int, default=1)
+    parser.add_argument("--sender-every", type=int, default=10, help="every Nth socket sends messages")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between messages per sender")
+    parser.add_argument("--duration", type=int, default=60)
+    parser.add_argument("--connect-concurrency", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,78 @@
+"""
+Coalesced read cursors for chat rooms - مؤشرات القراءة المجمعة
+
+Read state is a single high-water mark per (user, room): the room sequence of
+the newest message the user has read. Clients report reads as often as they
+like; the buffer keeps only the highest mark per key and a background task
+writes all pending marks in one statement every flush interval. Marks only
+ever move forward, both here and in the UPDATE.
+"""
+from typing import Dict, List, Optional, Tuple
+import asyncio
+
+DEFAULT_FLUSH_INTERVAL = 0.25  # seconds
+
+FLUSH_QUERY = """
+UPDATE chat_system.chat_participants AS p
+SET last_read_seq = v.seq,
+    last_read_message_id = v.message_id,
+    last_read_at = NOW()
+FROM unnest($1::int[], $2::int[], $3::bigint[], $4::int[]) AS v(user_id, room_id, seq, message_id)
+WHERE p.user_id = v.user_id AND p.room_id = v.room_id AND p.last_read_seq < v.seq
+"""
+
+
+class ReadCursorBuffer:
+    def __init__(self, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.pending: Dict[Tuple[int, int], Tuple[int, int]] = {}  # (user_id, room_id) -> (seq, message_id)
+        self.flushed_rows = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def mark(self, user_id: int, room_id: int, seq: int, message_id: int):
+        key = (user_id, room_id)
+        current = self.pending.get(key)
+        if current is None or current[0] < seq:
+            self.pending[key] = (seq, message_id)
+
+    async def flush(self, pool):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        users: List[int] = []
+        rooms: List[int] = []
+        seqs: List[int] = []
+        message_ids: List[int] = []
+        for (user_id, room_id), (seq, message_id) in batch.items():
+            users.append(user_id)
+            rooms.append(room_id)
+            seqs.append(seq)
+            message_ids.append(message_id)
+        try:
+            async with pool.acquire() as conn:
+                await conn.execute(FLUSH_QUERY, users, rooms, seqs, message_ids)
+            self.flushed_rows += len(users)
+        except Exception:
+            # Put the marks back unless newer ones arrived meanwhile, and retry next tick
+            for key, value in batch.items():
+                current = self.pending.get(key)
+                if current is None or current[0] < value[0]:
+                    self.pending[key] = value
+            raise
+
+    async def run(self, pool):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush(pool)
+            except Exception as e:
+                print(f"Read cursor flush failed: {e}")
+
+    def start(self, pool):
+        self._task = asyncio.create_task(self.run(pool))
+
+    async def stop(self, pool):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush(pool)
@@ -1,6 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from shared.instrumentation import instrument_app
+
 app = FastAPI(title="Reporting Service", version="1.0.0")
 
 app.add_middleware(
@@ -11,6 +13,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+instrument_app(app, "reporting")
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
@@ -0,0 +1,292 @@
+"""
+Faceted catalog search index - فهرس البحث والتصفية في دليل الخدمات
+
+Built from each shared.catalog snapshot as it is swapped in (the snapshot is
+reloaded on NOTIFY catalog_changed), so listing, search, filters and facet
+counts never touch the database:
+
+    postings     category -> positions and tag -> positions, an inverted
+                 index over the same tags the GIN index on services.tags covers
+    orders       positions sorted by name, price and duration, with the
+                 (key, id) list of each for keyset cursors
+    words        sorted (word, position) pairs from name, name_ar and
+                 service_code; a prefix is a bisect and a short scan
+    facets       counts for the unfiltered catalog, computed once per build
+
+Only available services in active categories are indexed. Arabic is folded
+(hamza forms of alef, taa marbuta, alef maqsura, diacritics and tatweel) and
+words are also indexed without the article, so "زيت" finds "الزَّيـت".
+
+Facets follow the usual drill-sideways rule: category, price and duration
+counts ignore their own filter (they are multi-select / range choices), tag
+counts are within the full result (tags narrow, like tags @> ARRAY[...]).
+
+    index = CatalogIndex(catalog.snapshot)
+    page = index.search(SearchQuery(q="oil", tags=("engine",)), sort="price", limit=24)
+    page = index.search(query, sort="price", cursor=page["next_cursor"])
+"""
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from heapq import nsmallest
+from itertools import islice
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+import base64
+import json
+import os
+import re
+
+from shared.catalog import CatalogService, CatalogSnapshot
+
+
+def _edges(value: str) -> Tuple[Decimal, ...]:
+    return tuple(sorted(Decimal(edge) for edge in value.split(",") if edge.strip()))
+
+
+PRICE_BUCKETS = _edges(os.getenv("CATALOG_PRICE_BUCKETS", "0,5000,10000,25000,50000,100000"))
+DURATION_BUCKETS = _edges(os.getenv("CATALOG_DURATION_BUCKETS", "0,30,60,120,240"))  # minutes
+TAG_FACET_SIZE = int(os.getenv("CATALOG_TAG_FACET_SIZE", "30"))
+NO_DURATION = 10 ** 9  # sorts services without an estimate last
+
+_ARABIC_FOLD = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ة": "ه", "ى": "ي", "ـ": None})
+_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670]")
+_WORD = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    """Case- and spelling-insensitive form of English or Arabic text."""
+    return _DIACRITICS.sub("", text.casefold().translate(_ARABIC_FOLD))
+
+
+def _words(text: str) -> List[str]:
+    """Indexed words; Arabic words are also indexed without the article, so "زيت" finds "الزيت"."""
+    words = _WORD.findall(fold(text))
+    return words + [word[2:] for word in words if word.startswith("ال") and len(word) > 3]
+
+
+class SearchQuery(NamedTuple):
+    q: str = ""
+    category_ids: Tuple[int, ...] = ()
+    tags: Tuple[str, ...] = ()
+    min_price: Optional[Decimal] = None
+    max_price: Optional[Decimal] = None
+    min_duration: Optional[int] = None
+    max_duration: Optional[int] = None
+    featured: Optional[bool] = None
+
+
+class _Order(NamedTuple):
+    positions: Tuple[int, ...]
+    keys: List[tuple]  # (key, id) per position, ascending
+    rank: List[int]  # rank[position] = index into positions
+    parse: Callable[[Any], Any]  # cursor JSON value -> key
+
+
+def _range(values: List, low, high) -> slice:
+    return slice(0 if low is None else bisect_left(values, low),
+                 len(values) if high is None else bisect_right(values, high))
+
+
+def _bucket(edges: Sequence[Decimal], value) -> int:
+    return -1 if value is None else bisect_right(edges, value) - 1
+
+
+def _intersect(sets: Sequence[Optional[Set[int]]]) -> Optional[Set[int]]:
+    """None stands for every position."""
+    chosen = sorted((s for s in sets if s is not None), key=len)
+    if not chosen:
+        return None
+    result = set(chosen[0])
+    for other in chosen[1:]:
+        result &= other
+    return result
+
+
+class CatalogIndex:
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.version = snapshot.version
+        self.categories = tuple(category for category in snapshot.categories if category.is_active)
+        active = {category.id for category in self.categories}
+        services: Tuple[CatalogService, ...] = tuple(
+            service for service in snapshot.services if service.status == "Available" and service.category_id in active
+        )
+        self.services = services
+        self.items = tuple(self._item(service) for service in services)
+        self.by_id = {service.id: position for position, service in enumerate(services)}
+
+        self.category_of = [service.category_id for service in services]
+        self.tags_of = [frozenset(tag.strip().lower() for tag in service.tags if tag.strip()) for service in services]
+        self.price_bucket_of = [_bucket(PRICE_BUCKETS, service.base_price) for service in services]
+        self.duration_bucket_of = [_bucket(DURATION_BUCKETS, service.estimated_duration) for service in services]
+
+        self.by_category: Dict[int, Set[int]] = {}
+        self.by_tag: Dict[str, Set[int]] = {}
+        for position, service in enumerate(services):
+            self.by_category.setdefault(service.category_id, set()).add(position)
+            for tag in self.tags_of[position]:
+                self.by_tag.setdefault(tag, set()).add(position)
+        self.featured = {position for position, service in enumerate(services) if service.is_featured}
+
+        self.words: List[Tuple[str, int]] = sorted({
+            (word, position)
+            for position, service in enumerate(services)
+            for text in (service.name, service.name_ar, service.service_code)
+            for word in _words(text or "")
+        })
+
+        self.orders = {
+            "name": self._order(lambda s: (fold(s.name), s.id), str),
+            "price": self._order(lambda s: (s.base_price, s.id), Decimal),
+            "-price": self._order(lambda s: (-s.base_price, s.id), Decimal),
+            "duration": self._order(
+                lambda s: (NO_DURATION if s.estimated_duration is None else s.estimated_duration, s.id), int
+            ),
+        }
+        self.all_facets = self._facets(None, {})
+
+    @staticmethod
+    def _item(service: CatalogService) -> Dict[str, Any]:
+        prices = [service.base_price, *(tier.price for tier in service.tiers)]
+        return {
+            "id": service.id,
+            "service_code": service.service_code,
+            "category_id": service.category_id,
+            "name": service.name,
+            "name_ar": service.name_ar,
+            "base_price": float(service.base_price),
+            "price_from": float(min(prices)),
+            "currency": service.currency,
+            "estimated_duration": service.estimated_duration,
+            "is_featured": service.is_featured,
+            "tags": list(service.tags),
+        }
+
+    def _order(self, key: Callable[[CatalogService], tuple], parse: Callable[[Any], Any]) -> _Order:
+        keyed = sorted((key(service), position) for position, service in enumerate(self.services))
+        rank = [0] * len(keyed)
+        for index, (_key, position) in enumerate(keyed):
+            rank[position] = index
+        return _Order(tuple(position for _key, position in keyed), [k for k, _position in keyed], rank, parse)
+
+    # Filters: one set of positions per dimension, None when the dimension is not filtered
+
+    def _prefix(self, term: str) -> Set[int]:
+        found = set()
+        for word, position in islice(self.words, bisect_left(self.words, (term,)), None):
+            if not word.startswith(term):
+                break
+            found.add(position)
+        return found
+
+    def _filters(self, query: SearchQuery) -> Dict[str, Optional[Set[int]]]:
+        filters: Dict[str, Optional[Set[int]]] = {}
+        terms = _WORD.findall(fold(query.q))
+        if terms:
+            filters["q"] = _intersect([self._prefix(term) for term in terms])
+        if query.category_ids:
+            filters["category"] = set().union(*(self.by_category.get(c, ()) for c in query.category_ids))
+        if query.tags:
+            filters["tags"] = _intersect([self.by_tag.get(tag.strip().lower(), set()) for tag in query.tags])
+        if query.min_price is not None or query.max_price is not None:
+            order = self.orders["price"]
+            window = _range(order.keys, None if query.min_price is None else (query.min_price,),
+                            None if query.max_price is None else (query.max_price, float("inf")))
+            filters["price"] = set(order.positions[window])
+        if query.min_duration is not None or query.max_duration is not None:
+            order = self.orders["duration"]
+            window = _range(order.keys, None if query.min_duration is None else (query.min_duration,),
+                            (NO_DURATION - 1 if query.max_duration is None else query.max_duration, float("inf")))
+            filters["duration"] = set(order.positions[window])
+        if query.featured is not None:
+            filters["featured"] = (self.featured if query.featured
+                                   else set(range(len(self.services))) - self.featured)
+        return filters
+
+    # Facets
+
+    def _positions(self, subset: Optional[Set[int]]):
+        return range(len(self.services)) if subset is None else subset
+
+    def _facets(self, matched: Optional[Set[int]], filters: Dict[str, Optional[Set[int]]],
+                selected_tags: Sequence[str] = ()) -> Dict[str, list]:
+        def excluding(dimension: str):
+            return self._positions(_intersect([s for d, s in filters.items() if d != dimension]))
+
+        categories = Counter(self.category_of[p] for p in excluding("category"))
+        prices = Counter(self.price_bucket_of[p] for p in excluding("price"))
+        durations = Counter(self.duration_bucket_of[p] for p in excluding("duration"))
+        tags = Counter(tag for p in self._positions(matched) for tag in self.tags_of[p])
+
+        top_tags = [tag for tag, _count in tags.most_common(TAG_FACET_SIZE)]
+        top_tags += [tag for tag in (t.strip().lower() for t in selected_tags) if tag not in top_tags]
+        return {
+            "categories": [
+                {"id": c.id, "name": c.name, "name_ar": c.name_ar, "count": categories[c.id]}
+                for c in self.categories
+            ],
+            "price": self._bucket_facet(PRICE_BUCKETS, prices, float),
+            "duration": self._bucket_facet(DURATION_BUCKETS, durations, int),
+            "tags": [{"tag": tag, "count": tags[tag]} for tag in top_tags],
+        }
+
+    @staticmethod
+    def _bucket_facet(edges: Sequence[Decimal], counts: Counter, cast) -> List[Dict[str, Any]]:
+        return [
+            {"min": cast(low), "max": cast(edges[i + 1]) if i + 1 < len(edges) else None, "count": counts[i]}
+            for i, low in enumerate(edges)
+        ]
+
+    # Cursors: the (key, id) of the last row, so a page stays stable across reloads
+
+    @staticmethod
+    def encode_cursor(sort: str, key: tuple) -> str:
+        value, last_id = key
+        raw = json.dumps([sort, str(value) if isinstance(value, Decimal) else value, last_id])
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+    def decode_cursor(self, sort: str, cursor: str) -> tuple:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            cursor_sort, value, last_id = json.loads(raw)
+            if cursor_sort != sort:
+                raise ValueError("cursor was issued for another sort order")
+            return self.orders[sort].parse(value), int(last_id)
+        except (ValueError, TypeError, InvalidOperation, UnicodeDecodeError) as e:
+            raise ValueError(f"Invalid cursor: {e}") from None
+
+    def search(self, query: SearchQuery, sort: str = "name", cursor: Optional[str] = None, limit: int = 24,
+               facets: bool = True) -> Dict[str, Any]:
+        """One page of matching services plus facet counts; raises ValueError for a bad sort or cursor."""
+        order = self.orders.get(sort)
+        if order is None:
+            raise ValueError(f"Unknown sort; expected one of {', '.join(self.orders)}")
+        start = 0 if cursor is None else bisect_right(order.keys, self.decode_cursor(sort, cursor))
+
+        filters = self._filters(query)
+        matched = _intersect(list(filters.values()))
+        if matched is None:
+            page = list(order.positions[start:start + limit + 1])
+        elif len(matched) * 8 < len(order.positions) - start:
+            # Few matches: rank them instead of walking the whole order
+            page = [order.positions[r] for r in nsmallest(limit + 1, (order.rank[p] for p in matched
+                                                                       if order.rank[p] >= start))]
+        else:
+            page = list(islice((p for p in order.positions[start:] if p in matched), limit + 1))
+
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = self.encode_cursor(sort, order.keys[order.rank[page[-1]]])
+        result = {
+            "items": [self.items[p] for p in page],
+            "total": len(self.services) if matched is None else len(matched),
+            "next_cursor": next_cursor,
+            "version": self.version,
+        }
+        if facets:
+            result["facets"] = self.all_facets if not filters else self._facets(matched, filters, query.tags)
+        return result
+
+    def service(self, service_id: int) -> Optional[CatalogService]:
+        position = self.by_id.get(service_id)
+        return None if position is None else self.services[position]
@@ -9,6 +9,7 @@ from api.api import api_router
 from core.config import settings
 from db.session import engine
 from db.models import Base
+from shared.instrumentation import instrument_app
 
 # Add the service directory to Python path to handle absolute imports
 sys.path.insert(0, str(Path(__file__).parent))
@@ -32,6 +33,8 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_headers=["*"],
     )
 
+instrument_app(app, "user_management", engine=engine)
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
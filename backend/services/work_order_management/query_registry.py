@@ -0,0 +1,222 @@
+"""
+Named prepared statements for hot queries - سجل الاستعلامات المُعدّة مسبقاً
+
+Hot statements are declared once here by name. Every pooled connection
+prepares them when it is opened (init_connection), so a request only sends
+Bind/Execute instead of Parse/Plan. Connections that did not go through the
+pool prepare lazily on first use. Each statement keeps call/error counts and
+a latency histogram, exposed by snapshot().
+"""
+from typing import Any, Dict, List, Optional
+import bisect
+import logging
+import time
+import weakref
+
+import asyncpg
+
+from shared.instrumentation import observe_query
+
+logger = logging.getLogger("yaman.query_registry")
+
+# Latency histogram upper bounds in milliseconds; the last bucket is +Inf
+LATENCY_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+HOT_QUERIES: Dict[str, str] = {
+    # Inspections
+    "inspection.get": """
+    SELECT id, uuid, inspection_number, customer_id, vehicle_type_id, vehicle_make, vehicle_model,
+           vehicle_year, vehicle_vin, vehicle_license_plate, vehicle_mileage, vehicle_color, vehicle_trim,
+           inspection_type, status, inspector_id, customer_complaint, observations, recommendations,
+           attachments, scheduled_date, started_at, completed_at, converted_to_work_order_id,
+           converted_by, converted_at, created_by, created_at, updated_at
+    FROM work_orders.inspections
+    WHERE id = $1
+    """,
+    "inspection.details": """
+    SELECT id, inspection_number, customer_id, vehicle_make, vehicle_model,
+           vehicle_year, vehicle_vin, vehicle_license_plate, vehicle_mileage,
+           vehicle_color, status, customer_complaint, created_at
+    FROM work_orders.inspections
+    WHERE id = $1
+    """,
+    "inspection.faults": """
+    SELECT id, fault_category AS category, fault_description AS description, severity, notes
+    FROM work_orders.inspection_faults
+    WHERE inspection_id = $1
+    """,
+    "inspection.service_assignments": """
+    SELECT id, service_name, assigned_engineer_id AS engineer_id, estimated_duration, estimated_cost
+    FROM work_orders.inspection_services
+    WHERE inspection_id = $1
+    """,
+
+    # Quotes
+    "quote.get": """
+    SELECT id, uuid, quote_number, inspection_id, work_order_id, customer_id, total_amount,
+           currency, valid_until, notes, status, sent_at, accepted_at, rejected_at,
+           created_by, accepted_by, created_at, updated_at
+    FROM work_orders.quotes
+    WHERE id = $1
+    """,
+    "quote.items": """
+    SELECT id, service_name, description, quantity, unit_price, total_price, estimated_duration, notes
+    FROM work_orders.quote_items
+    WHERE quote_id = $1
+    ORDER BY id
+    """,
+
+    # Task updates; work_order_tasks spells its statuses 'In_Progress' and 'Completed',
+    # which the scheduler and the ETA estimator filter on
+    "task.start": """
+    UPDATE work_orders.work_order_tasks
+    SET status = 'In_Progress', started_at = NOW(), updated_at = NOW()
+    WHERE id = $1 AND assigned_to = $2
+    RETURNING id, work_order_id, task_name AS service_name, status, started_at
+    """,
+    "task.complete": """
+    UPDATE work_orders.work_order_tasks
+    SET status = 'Completed', completed_at = NOW(), notes = $1,
+        actual_duration = CASE WHEN started_at IS NOT NULL
+                               THEN CEIL(EXTRACT(EPOCH FROM NOW() - started_at) / 60)::int END,
+        updated_at = NOW()
+    WHERE id = $2 AND assigned_to = $3
+    RETURNING id, work_order_id, task_name AS service_name, status, completed_at
+    """,
+
+    # Chat (chat_system.messages, the chat service's table; keyset on (created_at, id)
+    # is served by idx_messages_room_created_id)
+    "chat.send": """
+    INSERT INTO chat_system.messages (
+        uuid, room_id, sender_id, message_text, message_type, attachments
+    )
+    VALUES ($1, $2, $3, $4, $5, $6)
+    RETURNING id, uuid, room_seq, created_at AS sent_at
+    """,
+    "chat.history_latest": """
+    SELECT id, uuid, sender_id, message_text, message_type,
+           attachments, created_at AS sent_at
+    FROM chat_system.messages
+    WHERE room_id = $1 AND is_deleted = FALSE
+    ORDER BY created_at DESC, id DESC
+    LIMIT $2
+    """,
+    "chat.history_before": """
+    SELECT id, uuid, sender_id, message_text, message_type,
+           attachments, created_at AS sent_at
+    FROM chat_system.messages
+    WHERE room_id = $1 AND is_deleted = FALSE
+    AND (created_at, id) < (SELECT created_at, id FROM chat_system.messages WHERE id = $3)
+    ORDER BY created_at DESC, id DESC
+    LIMIT $2
+    """,
+    "chat.history_after": """
+    SELECT * FROM (
+        SELECT id, uuid, sender_id, message_text, message_type,
+               attachments, created_at AS sent_at
+        FROM chat_system.messages
+        WHERE room_id = $1 AND is_deleted = FALSE
+        AND (created_at, id) > (SELECT created_at, id FROM chat_system.messages WHERE id = $3)
+        ORDER BY created_at, id
+        LIMIT $2
+    ) newer
+    ORDER BY sent_at DESC, id DESC
+    """,
+}
+
+# Raised when a prepared plan no longer matches the schema; re-prepare once and retry
+STALE_STATEMENT_ERRORS = (asyncpg.exceptions.InvalidCachedStatementError, asyncpg.exceptions.FeatureNotSupportedError)
+
+
+class StatementStats:
+    __slots__ = ("calls", "errors", "total_ms", "max_ms", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, elapsed_ms: float, failed: bool):
+        self.calls += 1
+        if failed:
+            self.errors += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        buckets = {f"le_{bound}": count for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets)}
+        buckets["le_inf"] = self.buckets[-1]
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "histogram_ms": buckets,
+        }
+
+
+def _raw_connection(conn):
+    # Pool proxies change on every acquire; key statements on the underlying connection
+    return getattr(conn, "_con", None) or conn
+
+
+class QueryRegistry:
+    def __init__(self, queries: Dict[str, str]):
+        self.queries = dict(queries)
+        self.stats: Dict[str, StatementStats] = {name: StatementStats() for name in self.queries}
+        self._prepared: "weakref.WeakKeyDictionary[Any, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+
+    async def init_connection(self, conn):
+        """asyncpg pool `init` hook: prepare every hot statement on a new connection."""
+        statements = self._prepared.setdefault(_raw_connection(conn), {})
+        for name, sql in self.queries.items():
+            try:
+                statements[name] = await conn.prepare(sql)
+            except asyncpg.PostgresError as e:
+                # e.g. a table from a later migration; the statement is prepared on first use instead
+                logger.warning("could not prepare %s, preparing on first use: %s", name, e)
+
+    async def _statement(self, conn, name: str, refresh: bool = False):
+        statements = self._prepared.setdefault(_raw_connection(conn), {})
+        statement = statements.get(name)
+        if statement is None or refresh:
+            statement = statements[name] = await conn.prepare(self.queries[name])
+        return statement
+
+    async def _run(self, conn, name: str, method: str, args):
+        started = time.perf_counter()
+        error = None
+        try:
+            statement = await self._statement(conn, name)
+            try:
+                return await getattr(statement, method)(*args)
+            except STALE_STATEMENT_ERRORS:
+                statement = await self._statement(conn, name, refresh=True)
+                return await getattr(statement, method)(*args)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stats[name].observe(elapsed * 1000, error is not None)
+            # Prepared statements bypass asyncpg query loggers; report them to the shared metrics
+            observe_query(self.queries[name], elapsed, error)
+
+    async def fetch(self, conn, name: str, *args) -> List[asyncpg.Record]:
+        return await self._run(conn, name, "fetch", args)
+
+    async def fetchrow(self, conn, name: str, *args) -> Optional[asyncpg.Record]:
+        return await self._run(conn, name, "fetchrow", args)
+
+    async def fetchval(self, conn, name: str, *args) -> Any:
+        return await self._run(conn, name, "fetchval", args)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stats.as_dict() for name, stats in self.stats.items() if stats.calls}
+
+
+query_registry = QueryRegistry(HOT_QUERIES)
@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+import pytest
+from jose import jwt
+
+from shared.branches import (
+    DEFAULT_BRANCH_ID, TOKEN_ALGORITHM, TOKEN_SECRET_KEY, InvalidToken, resolve_branch_id, token_branch_id
+)
+
+
+def bearer(claims, secret=TOKEN_SECRET_KEY):
+    claims = {"sub": "engineer", "exp": datetime.utcnow() + timedelta(minutes=5), **claims}
+    return "Bearer " + jwt.encode(claims, secret, algorithm=TOKEN_ALGORITHM)
+
+
+def test_branch_comes_from_the_token():
+    assert token_branch_id(bearer({"branch_id": 2})) == 2
+    assert resolve_branch_id(None, 2) == 2
+    assert resolve_branch_id("2", 2) == 2
+
+
+def test_header_naming_another_branch_is_refused():
+    with pytest.raises(PermissionError):
+        resolve_branch_id("3", 2)
+    # Without a token only the default branch is reachable
+    assert resolve_branch_id(None, None) == DEFAULT_BRANCH_ID
+    with pytest.raises(PermissionError):
+        resolve_branch_id("2", None)
+
+
+def test_tokens_that_do_not_verify_are_rejected():
+    assert token_branch_id(None) is None
+    with pytest.raises(InvalidToken):
+        token_branch_id(bearer({"branch_id": 2}, secret="someone-else"))
+    with pytest.raises(InvalidToken):
+        token_branch_id(bearer({"branch_id": "2"}))
@@ -0,0 +1,26 @@
+from eta_estimator import ANY, FALLBACK_DURATION, DurationEstimator
+
+
+def make_estimator():
+    estimator = DurationEstimator()
+    estimator.replace([
+        {"service_key": "oil change", "vehicle_make": "toyota", "sample_count": 40,
+         "p50_minutes": 30, "p80_minutes": 40, "p90_minutes": 50},
+        {"service_key": "oil change", "vehicle_make": ANY, "sample_count": 90,
+         "p50_minutes": 35, "p80_minutes": 45, "p90_minutes": 55},
+        {"service_key": ANY, "vehicle_make": ANY, "sample_count": 900,
+         "p50_minutes": 60, "p80_minutes": 90, "p90_minutes": 120},
+    ])
+    return estimator
+
+
+def test_manual_estimate_is_kept():
+    assert make_estimator().estimate("Oil Change", "Toyota", manual_estimate=25) == 25
+
+
+def test_history_fills_missing_estimates():
+    estimator = make_estimator()
+    assert estimator.estimate(" Oil Change ", "TOYOTA") == 40
+    assert estimator.estimate("Oil Change", "Nissan") == 45
+    assert estimator.estimate("Brake pads", None, quantile="p50") == 60
+    assert DurationEstimator().estimate("Brake pads") == FALLBACK_DURATION
@@ -0,0 +1,113 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from datetime import date
+import asyncio
+import threading
+
+import pytest
+
+from shared.numbering import (
+    NUMBER_SHARD_RANGE, WORK_ORDER, NumberAllocator, SyncNumberAllocator, check_shard_indexes, format_number
+)
+
+TODAY = date(2026, 3, 1)
+
+
+class FakeShard:
+    """One database's counters, with allocate_number_block() semantics (13-number-counters.sql)."""
+
+    def __init__(self, shard_index: int = 0):
+        self.shard_index = shard_index
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def allocate(self, prefix: str, year: int, size: int) -> int:
+        with self.lock:
+            block_end = self.counters.get((prefix, year), 1) + size
+            self.counters[(prefix, year)] = block_end
+        return self.shard_index * NUMBER_SHARD_RANGE + block_end - size
+
+
+class FakeConnection:
+    def __init__(self, shard: FakeShard):
+        self.shard = shard
+
+    async def fetchval(self, sql, prefix, year, size):
+        # Yield around the upsert so concurrent callers interleave
+        await asyncio.sleep(0)
+        value = self.shard.allocate(prefix, year, size)
+        await asyncio.sleep(0)
+        return value
+
+
+class FakePool:
+    def __init__(self, shard: FakeShard):
+        self.shard = shard
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield FakeConnection(self.shard)
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar_one(self):
+        return self.value
+
+
+class FakeEngine:
+    def __init__(self, shard: FakeShard):
+        self.shard = shard
+
+    @contextmanager
+    def begin(self):
+        yield self
+
+    def execute(self, statement, params):
+        return FakeResult(self.shard.allocate(params["prefix"], params["year"], params["size"]))
+
+
+async def allocate_concurrently(default: FakeShard, east: FakeShard, workers: int, clients: int, count: int):
+    allocators = [NumberAllocator(block_size=7, today=lambda: TODAY) for _ in range(workers)]
+    for allocator in allocators:
+        allocator.bind(FakePool(default))
+    numbers = []
+
+    async def client(allocator):
+        for _ in range(count):
+            numbers.append(await allocator.next(WORK_ORDER))
+
+    async def trigger(shard: FakeShard):
+        # generate_work_order_number(): one number per row, on the shard the row is inserted into
+        conn = FakeConnection(shard)
+        for _ in range(count):
+            numbers.append(format_number(WORK_ORDER, TODAY.year, await conn.fetchval(None, WORK_ORDER, TODAY.year, 1)))
+
+    await asyncio.gather(
+        *(client(allocator) for allocator in allocators for _ in range(clients)),
+        *(trigger(shard) for shard in (default, east) for _ in range(clients)),
+    )
+    return numbers
+
+
+def test_concurrent_allocation_never_repeats_a_number():
+    default, east = FakeShard(0), FakeShard(1)
+    numbers = asyncio.run(allocate_concurrently(default, east, workers=4, clients=8, count=50))
+
+    # The synchronous app allocates from the same default counters, from several threads
+    sync_allocator = SyncNumberAllocator(FakeEngine(default), block_size=5, today=lambda: TODAY)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        numbers += pool.map(lambda _: sync_allocator.next(WORK_ORDER), range(400))
+
+    duplicates = [number for number, n in Counter(numbers).items() if n > 1]
+    assert not duplicates
+    assert len(numbers) == 4 * 8 * 50 + 2 * 8 * 50 + 400
+
+
+def test_shards_must_use_distinct_number_ranges():
+    check_shard_indexes({"default": 0, "east": 1, "west": 2})
+    with pytest.raises(ValueError, match="east"):
+        check_shard_indexes({"default": 0, "east": 0})
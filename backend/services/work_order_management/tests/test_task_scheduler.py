@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+import random
+
+import pytest
+
+from task_scheduler import EngineerCapacity, SchedulableTask, Shift, build_schedule
+
+HORIZON_START = datetime(2026, 1, 5, 8, 0, tzinfo=timezone.utc)
+HORIZON_END = HORIZON_START + timedelta(hours=10)
+SKILLS = ["engine", "electrical", "body", "ac"]
+
+
+def make_problem(seed: int, task_count: int = 120, engineer_count: int = 12):
+    rng = random.Random(seed)
+    tasks = [
+        SchedulableTask(
+            task_id=i,
+            work_order_id=i // 3,
+            task_name=f"task {i}",
+            priority=rng.choice(["Critical", "High", "Medium", "Low"]),
+            estimated_duration=rng.choice([15, 30, 45, 60, 90]),
+            required_skill=rng.choice(SKILLS + [None, None]),
+            scheduled_date=HORIZON_START + timedelta(minutes=rng.choice([0, 0, 30, 90, 240])),
+        )
+        for i in range(task_count)
+    ]
+    engineers = []
+    for j in range(engineer_count):
+        # Half the engineers work a split shift with a lunch break in between
+        shifts = []
+        if j % 2:
+            shifts = [
+                Shift(available_from=HORIZON_START, available_until=HORIZON_START + timedelta(hours=4)),
+                Shift(available_from=HORIZON_START + timedelta(hours=5), available_until=HORIZON_END),
+            ]
+        engineers.append(EngineerCapacity(engineer_id=j, skills=rng.sample(SKILLS, 2), shifts=shifts))
+    return tasks, engineers
+
+
+@pytest.mark.parametrize("improve", [False, True])
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_schedule_is_feasible(seed, improve):
+    tasks, engineers = make_problem(seed)
+    result = build_schedule(tasks, engineers, HORIZON_START, HORIZON_END, improve=improve)
+    by_task = {task.task_id: task for task in tasks}
+    by_engineer = {engineer.engineer_id: engineer for engineer in engineers}
+
+    assert len(result.assignments) + len(result.unassigned_task_ids) == len(tasks)
+
+    lanes = {}
+    for assignment in result.assignments:
+        task = by_task[assignment.task_id]
+        engineer = by_engineer[assignment.engineer_id]
+        # Skills
+        if task.required_skill:
+            assert task.required_skill in engineer.skills
+        # Release times and horizon
+        assert assignment.scheduled_start >= task.scheduled_date
+        assert HORIZON_START <= assignment.scheduled_start < assignment.scheduled_end <= HORIZON_END
+        # Inside a single shift
+        if engineer.shifts:
+            assert any(shift.available_from <= assignment.scheduled_start
+                       and assignment.scheduled_end <= shift.available_until for shift in engineer.shifts)
+        lanes.setdefault(assignment.engineer_id, []).append(assignment)
+
+    # No overlaps on an engineer
+    for lane in lanes.values():
+        lane.sort(key=lambda a: a.scheduled_start)
+        for earlier, later in zip(lane, lane[1:]):
+            assert earlier.scheduled_end <= later.scheduled_start
+
+
+def test_local_search_never_worsens_the_greedy_schedule():
+    tasks, engineers = make_problem(4)
+    greedy = build_schedule(tasks, engineers, HORIZON_START, HORIZON_END, improve=False)
+    improved = build_schedule(tasks, engineers, HORIZON_START, HORIZON_END, improve=True)
+
+    assert improved.unassigned_task_ids == greedy.unassigned_task_ids
+    assert improved.weighted_completion <= greedy.weighted_completion
+    assert improved.makespan_end <= greedy.makespan_end
+
+
+def test_task_is_not_booked_into_a_shift_gap():
+    engineers = [EngineerCapacity(engineer_id=1, shifts=[
+        Shift(available_from=HORIZON_START, available_until=HORIZON_START + timedelta(hours=1)),
+        Shift(available_from=HORIZON_START + timedelta(hours=3), available_until=HORIZON_END),
+    ])]
+    tasks = [SchedulableTask(task_id=1, work_order_id=1, task_name="long", estimated_duration=90)]
+
+    result = build_schedule(tasks, engineers, HORIZON_START, HORIZON_END)
+
+    assert result.assignments[0].scheduled_start == HORIZON_START + timedelta(hours=3)
@@ -0,0 +1,101 @@
+"""
+Compare two load test reports - مقارنة نتائج اختبارات الأداء
+
+Diffs per-endpoint p50/p95/p99 latency and throughput between a baseline and
+a candidate report written by load.py, and exits non-zero when any endpoint
+regresses by more than the threshold (so it can gate CI).
+
+Usage:
+    python benchmarks/compare.py results/base.json results/head.json [--threshold 10] [--metric p95_ms]
+"""
+from typing import Any, Dict, List, Tuple
+import argparse
+import json
+import sys
+
+LATENCY_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+# Endpoints with fewer samples are too noisy to gate on
+MIN_REQUESTS = 50
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def change(base: float, head: float) -> float:
+    if base == 0:
+        return 0.0 if head == 0 else float("inf")
+    return (head - base) / base * 100
+
+
+def compare(base: Dict[str, Any], head: Dict[str, Any], threshold: float,
+            metrics: Tuple[str, ...] = LATENCY_METRICS) -> Tuple[List[dict], List[str]]:
+    rows, regressions = [], []
+    endpoints = list(base["endpoints"]) + [name for name in head["endpoints"] if name not in base["endpoints"]]
+    for name in endpoints:
+        b, h = base["endpoints"].get(name), head["endpoints"].get(name)
+        if b is None or h is None:
+            rows.append({"endpoint": name, "note": "only in base" if h is None else "only in head"})
+            continue
+        row = {"endpoint": name}
+        for metric in LATENCY_METRICS + ("throughput_rps", "error_rate"):
+            row[metric] = (b[metric], h[metric], change(b[metric], h[metric]))
+        rows.append(row)
+
+        if min(b["requests"], h["requests"]) < MIN_REQUESTS:
+            continue
+        for metric in metrics:
+            if row[metric][2] > threshold:
+                regressions.append(f"{name}: {metric} {b[metric]:.2f} -> {h[metric]:.2f} ({row[metric][2]:+.1f}%)")
+        if change(b["throughput_rps"], h["throughput_rps"]) < -threshold:
+            regressions.append(
+                f"{name}: throughput {b['throughput_rps']:.1f} -> {h['throughput_rps']:.1f} req/s "
+                f"({row['throughput_rps'][2]:+.1f}%)"
+            )
+        if h["error_rate"] > b["error_rate"]:
+            regressions.append(f"{name}: error rate {b['error_rate']:.2%} -> {h['error_rate']:.2%}")
+    return rows, regressions
+
+
+def print_table(rows: List[dict]):
+    print(f"{'endpoint':48} {'p50 ms':>20} {'p95 ms':>20} {'p99 ms':>20} {'req/s':>20}")
+    for row in rows:
+        if "note" in row:
+            print(f"{row['endpoint']:48} ({row['note']})")
+            continue
+        cells = []
+        for metric in LATENCY_METRICS + ("throughput_rps",):
+            base, head, pct = row[metric]
+            cells.append(f"{base:7.1f}→{head:7.1f} {pct:+4.0f}%")
+        print(f"{row['endpoint']:48} " + " ".join(f"{cell:>20}" for cell in cells))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10, help="allowed regression in percent")
+    parser.add_argument("--metric", action="append", choices=LATENCY_METRICS,
+                        help="latency metrics to gate on (default: all percentiles)")
+    args = parser.parse_args(argv)
+
+    base, head = load(args.base), load(args.head)
+    for key in ("target", "concurrency", "duration_s"):
+        if base["meta"].get(key) != head["meta"].get(key):
+            print(f"warning: {key} differs ({base['meta'].get(key)} vs {head['meta'].get(key)})", file=sys.stderr)
+
+    rows, regressions = compare(base, head, args.threshold, tuple(args.metric or LATENCY_METRICS))
+    print(f"base {base['meta'].get('git_revision') or args.base}  head {head['meta'].get('git_revision') or args.head}\n")
+    print_table(rows)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:g}%:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"\nNo regressions over {args.threshold:g}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
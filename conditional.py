@@ -0,0 +1,118 @@
+"""
+Conditional GET for list and detail endpoints - الطلبات المشروطة (ETag / 304)
+
+Every table carries an `updated_at` kept current by triggers, so validators are
+cheap to compute without serializing anything:
+
+    collections  weak ETag from count(*) and max(updated_at) over the same
+                 filtered query, computed with one aggregate before the rows
+                 are fetched
+    resources    weak ETag from id and updated_at, plus Last-Modified
+    cached rows  rows_validators gives a collection the ETag the query would
+
+The response model's name and fields are part of every ETag, so changing a
+response shape invalidates what clients hold. Collections carry no
+Last-Modified: a deleted row does not move max(updated_at), only the count in
+the ETag catches it.
+
+    query = db.query(*columns_for(ServiceResponse, ServiceModel)).filter(...)
+    return conditional_response(
+        request,
+        collection_validators(query, ServiceModel.updated_at, ServiceResponse),
+        lambda: trusted_response(ServiceResponse, query.all()),
+    )
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, Type
+import hashlib
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+from sqlalchemy import func
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def weak_etag(*parts: Any) -> str:
+    digest = hashlib.blake2b("|".join(map(str, parts)).encode("utf-8"), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _schema_key(model: Type[BaseModel]) -> str:
+    return f"{model.__name__}({','.join(model.model_fields)})"
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+@dataclass(frozen=True)
+class Validators:
+    etag: str
+    last_modified: Optional[datetime] = None
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"ETag": self.etag, "Cache-Control": CACHE_CONTROL}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(self.last_modified, usegmt=True)
+        return headers
+
+
+def collection_validators(query, updated_at, model: Type[BaseModel]) -> Validators:
+    """Validators for the rows `query` would return, from one count/max aggregate."""
+    count, last_updated = query.order_by(None).with_entities(func.count(), func.max(updated_at)).one()
+    last_updated = _utc(last_updated)
+    return Validators(weak_etag(_schema_key(model), count, last_updated.isoformat() if last_updated else ""))
+
+
+def rows_validators(rows, model: Type[BaseModel]) -> Validators:
+    """collection_validators for rows already in memory; the same rows give the same ETag."""
+    last_updated = _utc(max((row.updated_at for row in rows if row.updated_at is not None), default=None))
+    return Validators(weak_etag(_schema_key(model), len(rows), last_updated.isoformat() if last_updated else ""))
+
+
+def resource_validators(resource, model: Type[BaseModel]) -> Validators:
+    updated_at = _utc(getattr(resource, "updated_at", None))
+    return Validators(
+        weak_etag(_schema_key(model), resource.id, updated_at.isoformat() if updated_at else ""),
+        updated_at.replace(microsecond=0) if updated_at else None,
+    )
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # Weak comparison (RFC 9110 13.1.2): the W/ prefix is ignored on both sides
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def is_not_modified(request: Request, validators: Validators) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence; If-Modified-Since is then ignored
+        return _etag_matches(if_none_match, validators.etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and validators.last_modified is not None:
+        try:
+            since = _utc(parsedate_to_datetime(if_modified_since))
+        except (TypeError, ValueError):
+            return False
+        return validators.last_modified <= since
+    return False
+
+
+def conditional_response(request: Request, validators: Validators, render: Callable[[], Response]) -> Response:
+    """304 when the client's copy is current, otherwise render() with the validators attached."""
+    if is_not_modified(request, validators):
+        return Response(status_code=304, headers=validators.headers())
+    response = render()
+    response.headers.update(validators.headers())
+    return response
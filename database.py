@@ -1,18 +1,56 @@
 """
 Database session management for Yaman Workshop Management System
+
+Writes and detail reads use the primary (get_db). List, dashboard and report
+endpoints may use get_read_db, which routes to a streaming replica from
+DATABASE_REPLICA_URLS (comma-separated) when one is configured and no more
+than REPLICA_MAX_LAG_SECONDS behind; otherwise it falls back to the primary.
+Replicas are picked round-robin and their lag is re-checked at most every
+REPLICA_CHECK_INTERVAL seconds.
+
+A client that has just written reads from the primary for
+READ_YOUR_WRITES_SECONDS, so it always sees its own changes: after every
+successful write ReadYourWritesMiddleware sets a short-lived cookie that
+get_read_db honours.
+
+Both dependencies are branch-scoped: the branch comes from the bearer
+token, and an X-Branch-Id header must match it (shared.branches). The
+session is bound to that branch's shard, ORM queries on BranchScoped models
+are filtered to the branch and new rows get it as their branch_id. Replicas
+apply to the default shard. Cross-branch reports and the login lookup use
+shard_router.scatter_gather(), which runs a query unscoped on every shard.
 """
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, TypeVar
+import itertools
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
-from models import Base
+import threading
+import time
+
+from fastapi import HTTPException, Request
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker, Session, with_loader_criteria
+from models import Base, BranchScoped
+from shared.branches import (
+    BRANCH_HEADER, DEFAULT_SHARD, InvalidToken, resolve_branch_id, shard_for, shard_urls, token_branch_id
+)
+from shared.instrumentation.metrics import registry
+
+T = TypeVar("T")
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
-engine = create_engine(
-    DATABASE_URL,
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "2"))
+# Longer than the lag a replica is allowed, so the write has been replayed when reads move back
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+READ_YOUR_WRITES_COOKIE = "db_primary_until"
+
+ENGINE_OPTIONS = dict(
     pool_pre_ping=True,
     pool_recycle=300,
     pool_size=10,
@@ -20,25 +58,227 @@ engine = create_engine(
     echo=False
 )
 
+engine = create_engine(DATABASE_URL, **ENGINE_OPTIONS)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
-def get_db():
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _filter_to_branch(state):
+    branch_id = state.session.info.get("branch_id")
+    if branch_id is not None and state.is_select and not state.is_column_load and not state.is_relationship_load:
+        state.statement = state.statement.options(
+            with_loader_criteria(BranchScoped, lambda cls: cls.branch_id == branch_id, include_aliases=True)
+        )
+
+
+@event.listens_for(SessionLocal, "after_begin")
+def _set_branch(session, transaction, connection):
+    # Transaction-local, so pooled connections never carry a branch over;
+    # read by the row security policies and the branch_id column defaults
+    branch_id = session.info.get("branch_id")
+    if branch_id is not None:
+        connection.execute(text("SELECT set_config('yaman.branch_id', :branch, true)"), {"branch": str(branch_id)})
+
+
+class ShardRouter:
+    """One engine per shard; branches map to shards via shared.branches."""
+
+    def __init__(self, default_engine, urls: Dict[str, str]):
+        self.engines = {
+            name: default_engine if name == DEFAULT_SHARD else create_engine(url, **ENGINE_OPTIONS)
+            for name, url in urls.items()
+        }
+
+    def engine_for(self, branch_id: int):
+        return self.engines[shard_for(branch_id)]
+
+    def session(self, branch_id: int, engine=None) -> Session:
+        return SessionLocal(bind=engine or self.engine_for(branch_id), info={"branch_id": branch_id})
+
+    def scatter_gather(self, query: Callable[[Session], T]) -> Dict[str, T]:
+        """Runs query(session) unscoped on every shard in parallel; results by shard name."""
+        def run(name):
+            db = SessionLocal(bind=self.engines[name], info={"shard": name})
+            try:
+                return query(db)
+            finally:
+                db.close()
+
+        if len(self.engines) == 1:
+            return {name: run(name) for name in self.engines}
+        with ThreadPoolExecutor(max_workers=len(self.engines)) as pool:
+            return dict(zip(self.engines, pool.map(run, self.engines)))
+
+
+shard_router = ShardRouter(engine, shard_urls(DATABASE_URL))
+
+
+def get_branch_id(request: Request) -> int:
+    """The authenticated user's branch; a mismatching X-Branch-Id header is refused."""
+    try:
+        token_branch = token_branch_id(request.headers.get("authorization"))
+    except InvalidToken:
+        raise HTTPException(status_code=401, detail="Invalid or expired token", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return resolve_branch_id(request.headers.get(BRANCH_HEADER), token_branch)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {BRANCH_HEADER} header")
+
+
+# Seconds of replay lag; 0 when caught up with everything received, or when
+# the server is not a standby at all (handy for local testing)
+REPLICA_LAG_SQL = text("""
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+""")
+
+read_sessions = registry.counter(
+    "db_read_sessions_total", "Read-only sessions by where they were routed", ("target",)
+)
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.engine = create_engine(url, **ENGINE_OPTIONS)
+        self.name = self.engine.url.render_as_string(hide_password=True)
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self.lock = threading.Lock()
+
+
+class ReplicaRouter:
+    """Round-robin over replicas whose last measured lag is within max_lag."""
+
+    def __init__(self, urls: List[str], max_lag: float = REPLICA_MAX_LAG_SECONDS,
+                 check_interval: float = REPLICA_CHECK_INTERVAL, clock=time.monotonic):
+        self.replicas = [Replica(url) for url in urls]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.clock = clock
+        self._turn = itertools.count()
+
+    def _check(self, replica: Replica):
+        if replica.checked_at is not None and self.clock() - replica.checked_at < self.check_interval:
+            return
+        # One request re-checks; concurrent ones use the previous measurement
+        if not replica.lock.acquire(blocking=False):
+            return
+        try:
+            with replica.engine.connect() as conn:
+                replica.lag = float(conn.execute(REPLICA_LAG_SQL).scalar())
+            replica.error = None
+        except Exception as exc:
+            replica.lag = None
+            replica.error = str(exc)
+        finally:
+            replica.checked_at = self.clock()
+            replica.lock.release()
+
+    def usable(self, replica: Replica) -> bool:
+        return replica.lag is not None and replica.lag <= self.max_lag
+
+    def pick(self) -> Optional[Replica]:
+        """Next usable replica, or None when all are lagging or down."""
+        if not self.replicas:
+            return None
+        start = next(self._turn)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            self._check(replica)
+            if self.usable(replica):
+                return replica
+        return None
+
+    def status(self) -> List[dict]:
+        return [
+            {"replica": r.name, "lag_seconds": r.lag, "usable": self.usable(r), "error": r.error}
+            for r in self.replicas
+        ]
+
+
+read_router = ReplicaRouter(DATABASE_REPLICA_URLS)
+
+
+def wrote_recently(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def get_db(request: Request):
     """
-    Dependency function to get database session
+    Dependency function to get a database session scoped to the request's branch
     Usage in FastAPI:
         from database import get_db
         @app.get("/")
         def endpoint(db: Session = Depends(get_db)):
             ...
     """
-    db = SessionLocal()
+    db = shard_router.session(get_branch_id(request))
     try:
         yield db
     finally:
         db.close()
 
 
+def get_read_db(request: Request):
+    """
+    Dependency for read-only endpoints that tolerate a few seconds of lag
+    (lists, dashboard, reports). Never write through this session.
+    """
+    branch_id = get_branch_id(request)
+    if shard_for(branch_id) != DEFAULT_SHARD:
+        target, replica = "shard", None
+    elif wrote_recently(request):
+        target, replica = "primary_sticky", None
+    else:
+        replica = read_router.pick()
+        if replica is not None:
+            target = "replica"
+        else:
+            target = "primary_fallback" if read_router.replicas else "primary"
+    read_sessions.inc(target)
+    db = shard_router.session(branch_id, replica.engine if replica is not None else None)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+class ReadYourWritesMiddleware:
+    """Pins a client's reads to the primary for a while after each successful write."""
+
+    WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+    def __init__(self, app, seconds: float = READ_YOUR_WRITES_SECONDS):
+        self.app = app
+        self.seconds = seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in self.WRITE_METHODS or not read_router.replicas:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = (
+                    f"{READ_YOUR_WRITES_COOKIE}={time.time() + self.seconds:.3f}; "
+                    f"Max-Age={int(self.seconds) + 1}; Path=/; HttpOnly; SameSite=Lax"
+                )
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
 def init_db():
     """
     Initialize database tables (only for development/testing)
@@ -0,0 +1,42 @@
+-- جدولة المهام على المهندسين حسب الطاقة الاستيعابية للورشة
+-- Workshop capacity scheduling for work order tasks
+
+-- مهارات المهندسين
+CREATE TABLE IF NOT EXISTS work_orders.engineer_skills (
+    id SERIAL PRIMARY KEY,
+    engineer_id INTEGER NOT NULL REFERENCES user_management.users(id) ON DELETE CASCADE,
+    skill VARCHAR(100) NOT NULL, -- mechanical, electrical, bodywork, diagnostics, hybrid_battery, ...
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(engineer_id, skill)
+);
+
+-- أوقات توفر المهندسين (ورديات العمل)
+CREATE TABLE IF NOT EXISTS work_orders.engineer_availability (
+    id SERIAL PRIMARY KEY,
+    engineer_id INTEGER NOT NULL REFERENCES user_management.users(id) ON DELETE CASCADE,
+    available_from TIMESTAMP WITH TIME ZONE NOT NULL,
+    available_until TIMESTAMP WITH TIME ZONE NOT NULL,
+    notes TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CHECK (available_until > available_from)
+);
+
+-- أعمدة الجدولة على مهام أوامر العمل
+ALTER TABLE work_orders.work_order_tasks ADD COLUMN IF NOT EXISTS required_skill VARCHAR(100);
+ALTER TABLE work_orders.work_order_tasks ADD COLUMN IF NOT EXISTS scheduled_start TIMESTAMP WITH TIME ZONE;
+ALTER TABLE work_orders.work_order_tasks ADD COLUMN IF NOT EXISTS scheduled_end TIMESTAMP WITH TIME ZONE;
+
+-- إنشاء الفهارس
+CREATE INDEX IF NOT EXISTS idx_engineer_skills_engineer_id ON work_orders.engineer_skills(engineer_id);
+CREATE INDEX IF NOT EXISTS idx_engineer_availability_engineer_window ON work_orders.engineer_availability(engineer_id, available_from, available_until);
+CREATE INDEX IF NOT EXISTS idx_work_order_tasks_open ON work_orders.work_order_tasks(status) WHERE status IN ('Pending', 'In_Progress');
+
+-- منح الصلاحيات
+GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA work_orders TO yaman_user;
+GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA work_orders TO yaman_user;
+
+-- إظهار رسالة نجاح
+DO $$
+BEGIN
+    RAISE NOTICE 'تم إعداد جداول جدولة المهام بنجاح - Task scheduling tables setup completed successfully';
+END $$;
@@ -0,0 +1,29 @@
+-- جداول تقدير مدة الخدمات من السجل التاريخي
+-- Precomputed service duration quantiles for ETA prediction
+
+-- جدول الكميات المحسوبة مسبقاً (يُعاد حسابه ليلياً)
+-- service_key = lower(trim(service_name)), '*' = all services
+-- vehicle_make = lower(vehicle_make), '*' = all makes
+CREATE TABLE IF NOT EXISTS work_orders.duration_quantiles (
+    service_key VARCHAR(255) NOT NULL,
+    vehicle_make VARCHAR(100) NOT NULL DEFAULT '*',
+    sample_count INTEGER NOT NULL,
+    p50_minutes INTEGER NOT NULL,
+    p80_minutes INTEGER NOT NULL,
+    p90_minutes INTEGER NOT NULL,
+    refreshed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (service_key, vehicle_make)
+);
+
+-- فهارس لتسريع جمع العينات عند إعادة الحساب
+CREATE INDEX IF NOT EXISTS idx_work_order_tasks_completed_at ON work_orders.work_order_tasks(completed_at) WHERE completed_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_work_orders_open_eta ON work_orders.work_orders(id) WHERE status IN ('Draft', 'Pending', 'In_Progress', 'On_Hold');
+
+-- منح الصلاحيات
+GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA work_orders TO yaman_user;
+
+-- إظهار رسالة نجاح
+DO $$
+BEGIN
+    RAISE NOTICE 'تم إعداد جداول تقدير المدة بنجاح - Duration estimate tables setup completed successfully';
+END $$;
@@ -0,0 +1,22 @@
+-- فهارس مركبة لتصفح سجل الدردشة بالمؤشر
+-- Composite indexes for cursor-paginated chat history
+
+-- تصفح رسائل الغرفة حسب (الوقت، المعرف) دون فرز إضافي
+CREATE INDEX IF NOT EXISTS idx_messages_room_created_id ON chat_system.messages(room_id, created_at DESC, id DESC);
+
+-- جدول رسائل أوامر العمل (يستخدمه PhaseSevenService) إن وجد
+DO $$
+BEGIN
+    IF to_regclass('work_orders.chat_messages') IS NOT NULL THEN
+        CREATE INDEX IF NOT EXISTS idx_chat_messages_room_sent_id ON work_orders.chat_messages(room_id, sent_at DESC, id DESC);
+    END IF;
+END $$;
+
+-- الفهرس المفرد على room_id أصبح مغطى بالفهرس المركب
+DROP INDEX IF EXISTS chat_system.idx_messages_room_id;
+
+-- إظهار رسالة نجاح
+DO $$
+BEGIN
+    RAISE NOTICE 'تم إعداد فهارس سجل الدردشة بنجاح - Chat history indexes setup completed successfully';
+END $$;
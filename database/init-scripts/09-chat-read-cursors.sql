@@ -0,0 +1,61 @@
+-- مؤشرات القراءة لكل مستخدم وغرفة بدلاً من صف لكل رسالة
+-- Per-(user, room) read cursors replacing per-message read rows
+
+-- تسلسل الرسائل داخل كل غرفة
+ALTER TABLE chat_system.chat_rooms ADD COLUMN IF NOT EXISTS last_message_seq BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE chat_system.messages ADD COLUMN IF NOT EXISTS room_seq BIGINT;
+
+-- مؤشر آخر رسالة مقروءة لكل مشارك
+ALTER TABLE chat_system.chat_participants ADD COLUMN IF NOT EXISTS last_read_message_id INTEGER REFERENCES chat_system.messages(id) ON DELETE SET NULL;
+ALTER TABLE chat_system.chat_participants ADD COLUMN IF NOT EXISTS last_read_seq BIGINT NOT NULL DEFAULT 0;
+
+-- ترقيم الرسائل الحالية
+WITH numbered AS (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY room_id ORDER BY created_at, id) AS seq
+    FROM chat_system.messages
+    WHERE room_seq IS NULL
+)
+UPDATE chat_system.messages m
+SET room_seq = numbered.seq
+FROM numbered
+WHERE m.id = numbered.id;
+
+UPDATE chat_system.chat_rooms r
+SET last_message_seq = COALESCE((SELECT MAX(room_seq) FROM chat_system.messages WHERE room_id = r.id), 0);
+
+-- تحويل last_read_at الحالي إلى مؤشر تسلسلي
+UPDATE chat_system.chat_participants p
+SET last_read_seq = COALESCE((
+    SELECT MAX(m.room_seq) FROM chat_system.messages m
+    WHERE m.room_id = p.room_id AND m.created_at <= p.last_read_at
+), 0)
+WHERE p.last_read_seq = 0 AND p.last_read_at IS NOT NULL;
+
+-- دالة تعيين تسلسل الرسالة عند الإدراج
+CREATE OR REPLACE FUNCTION chat_system.assign_room_seq()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE chat_system.chat_rooms
+    SET last_message_seq = last_message_seq + 1
+    WHERE id = NEW.room_id
+    RETURNING last_message_seq INTO NEW.room_seq;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS assign_messages_room_seq ON chat_system.messages;
+CREATE TRIGGER assign_messages_room_seq BEFORE INSERT ON chat_system.messages
+    FOR EACH ROW EXECUTE FUNCTION chat_system.assign_room_seq();
+
+-- إنشاء الفهارس
+CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_room_seq ON chat_system.messages(room_id, room_seq);
+CREATE INDEX IF NOT EXISTS idx_chat_participants_user_active ON chat_system.chat_participants(user_id, room_id) WHERE is_active = TRUE;
+
+-- منح الصلاحيات
+GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA chat_system TO yaman_user;
+
+-- إظهار رسالة نجاح
+DO $$
+BEGIN
+    RAISE NOTICE 'تم إعداد مؤشرات القراءة بنجاح - Chat read cursors setup completed successfully';
+END $$;
@@ -0,0 +1,30 @@
+-- صندوق الإرسال الدائم للإشعارات
+-- Durable notification outbox for the delivery dispatcher
+
+-- أعمدة المحاولات وإعادة الجدولة
+ALTER TABLE work_orders.notifications ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE work_orders.notifications ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE work_orders.notifications ADD COLUMN IF NOT EXISTS locked_until TIMESTAMP WITH TIME ZONE;
+ALTER TABLE work_orders.notifications ADD COLUMN IF NOT EXISTS last_attempt_at TIMESTAMP WITH TIME ZONE;
+
+-- فهرس الإشعارات المستحقة للإرسال
+CREATE INDEX IF NOT EXISTS idx_notifications_outbox_due ON work_orders.notifications(next_attempt_at, id) WHERE status = 'Pending';
+
+-- تنبيه المرسل عند إضافة إشعار جديد (يُرسل بعد تأكيد المعاملة)
+CREATE OR REPLACE FUNCTION work_orders.notify_notification_outbox()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('notification_outbox', NEW.notification_type::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notifications_outbox_wakeup ON work_orders.notifications;
+CREATE TRIGGER notifications_outbox_wakeup AFTER INSERT ON work_orders.notifications
+    FOR EACH ROW WHEN (NEW.status = 'Pending') EXECUTE FUNCTION work_orders.notify_notification_outbox();
+
+-- إظهار رسالة نجاح
+DO $$
+BEGIN
+    RAISE NOTICE 'تم إعداد صندوق إرسال الإشعارات بنجاح - Notification outbox setup completed successfully';
+END $$;
@@ -0,0 +1,35 @@
+-- دمج الإشعارات والملخص اليومي
+-- Notification coalescing and daily digests
+
+-- تفضيلات الإشعارات لكل مستخدم
+CREATE TABLE IF NOT EXISTS work_orders.notification_preferences (
+    user_id INTEGER PRIMARY KEY REFERENCES user_management.users(id) ON DELETE CASCADE,
+    preferred_channel notification_type_enum,
+    delivery_mode VARCHAR(20) NOT NULL DEFAULT 'immediate' CHECK (delivery_mode IN ('immediate', 'digest')),
+    digest_hour SMALLINT NOT NULL DEFAULT 18 CHECK (digest_hour BETWEEN 0 AND 23), -- local workshop time
+    coalesce_window_seconds INTEGER CHECK (coalesce_window_seconds >= 0), -- NULL = service default
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- أعمدة الدمج والملخص على جدول الإشعارات
+ALTER TABLE work_orders.notifications ADD COLUMN IF NOT EXISTS coalesced_count INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE work_orders.notifications ADD COLUMN IF NOT EXISTS held_for_digest BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE work_orders.notifications ADD COLUMN IF NOT EXISTS digest_notification_id INTEGER REFERENCES work_orders.notifications(id);
+
+-- الإشعارات المحجوزة للملخص لا تدخل طابور الإرسال
+DROP INDEX IF EXISTS work_orders.idx_notifications_outbox_due;
+CREATE INDEX IF NOT EXISTS idx_notifications_outbox_due ON work_orders.notifications(next_attempt_at, id) WHERE status = 'Pending' AND held_for_digest = FALSE;
+
+-- البحث عن إشعار قيد الانتظار لنفس المستلم والمرجع
+CREATE INDEX IF NOT EXISTS idx_notifications_coalesce ON work_orders.notifications(recipient_id, reference_type, reference_id) WHERE status = 'Pending';
+CREATE INDEX IF NOT EXISTS idx_notifications_held ON work_orders.notifications(recipient_id, created_at) WHERE held_for_digest = TRUE;
+
+-- منح الصلاحيات
+GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA work_orders TO yaman_user;
+
+-- إظهار رسالة نجاح
+DO $$
+BEGIN
+    RAISE NOTICE 'تم إعداد دمج الإشعارات بنجاح - Notification coalescing setup completed successfully';
+END $$;
@@ -0,0 +1,29 @@
+-- تخزين صور التوقيعات خارج الجداول
+-- Off-row storage for signature images (content-addressed files on disk)
+
+-- مرجع الملف: SHA-256 للمحتوى المخزن وحجمه ونوعه
+ALTER TABLE work_orders.electronic_signatures ADD COLUMN IF NOT EXISTS signature_hash CHAR(64);
+ALTER TABLE work_orders.electronic_signatures ADD COLUMN IF NOT EXISTS signature_size INTEGER;
+ALTER TABLE work_orders.electronic_signatures ADD COLUMN IF NOT EXISTS signature_mime VARCHAR(50);
+ALTER TABLE work_orders.electronic_signatures ALTER COLUMN signature_data DROP NOT NULL;
+
+-- جدول توقيعات التسليم (يستخدمه PhaseFiveService) إن وجد
+DO $$
+BEGIN
+    IF to_regclass('work_orders.delivery_signatures') IS NOT NULL THEN
+        EXECUTE 'ALTER TABLE work_orders.delivery_signatures ADD COLUMN IF NOT EXISTS signature_hash CHAR(64)';
+        EXECUTE 'ALTER TABLE work_orders.delivery_signatures ADD COLUMN IF NOT EXISTS signature_size INTEGER';
+        EXECUTE 'ALTER TABLE work_orders.delivery_signatures ADD COLUMN IF NOT EXISTS signature_mime VARCHAR(50)';
+        EXECUTE 'ALTER TABLE work_orders.delivery_signatures ALTER COLUMN signature_data DROP NOT NULL';
+        EXECUTE 'CREATE INDEX IF NOT EXISTS idx_delivery_signatures_unmigrated ON work_orders.delivery_signatures(id) WHERE signature_hash IS NULL AND signature_data IS NOT NULL';
+    END IF;
+END $$;
+
+-- فهرس الصفوف التي لم تُنقل بعد
+CREATE INDEX IF NOT EXISTS idx_electronic_signatures_unmigrated ON work_orders.electronic_signatures(id) WHERE signature_hash IS NULL AND signature_data IS NOT NULL;
+
+-- إظهار رسالة نجاح
+DO $$
+BEGIN
+    RAISE NOTICE 'تم إعداد تخزين التوقيعات بنجاح - Signature blob storage setup completed successfully';
+END $$;
@@ -0,0 +1,125 @@
+-- عدادات الأرقام التسلسلية للمستندات
+-- Per-prefix, per-year document number counters with block allocation
+
+-- صف واحد لكل بادئة وسنة؛ next_value هو أول رقم لم يُحجز بعد
+CREATE TABLE IF NOT EXISTS work_orders.number_counters (
+    prefix VARCHAR(20) NOT NULL,
+    year SMALLINT NOT NULL,
+    next_value BIGINT NOT NULL DEFAULT 1 CHECK (next_value > 0),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (prefix, year)
+);
+
+-- مدى الأرقام لكل قاعدة بيانات (شارد)
+-- Every shard keeps its own counters, so each database numbers within its own
+-- range: shard_index * 10,000,000 + counter. Rows inserted by the triggers on
+-- shard N can then never take a number that another shard, or the services'
+-- block allocator (which reserves on the default shard, index 0), hands out.
+-- Give every extra shard a distinct index once, after initialising it:
+--     UPDATE work_orders.number_shard SET shard_index = 1;
+-- The services refuse to start when two shards share an index (shared/numbering.py).
+CREATE TABLE IF NOT EXISTS work_orders.number_shard (
+    singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+    shard_index SMALLINT NOT NULL DEFAULT 0 CHECK (shard_index BETWEEN 0 AND 99)
+);
+INSERT INTO work_orders.number_shard (singleton) VALUES (TRUE) ON CONFLICT (singleton) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION number_shard_index()
+RETURNS INTEGER AS $$
+    SELECT COALESCE((SELECT shard_index FROM work_orders.number_shard), 0);
+$$ LANGUAGE sql STABLE;
+
+-- حجز كتلة من الأرقام: تحديث صف واحد بدلاً من مسح الجدول بـ MAX()
+-- Returns the first number of a block of p_size; the caller owns
+-- [result, result + p_size). Call it outside long transactions: the counter
+-- row stays locked until the calling transaction ends. The counter itself is
+-- local; the shard's range offset is added on the way out.
+CREATE OR REPLACE FUNCTION allocate_number_block(p_prefix TEXT, p_year INTEGER, p_size INTEGER DEFAULT 1)
+RETURNS BIGINT AS $$
+DECLARE
+    block_end BIGINT;
+BEGIN
+    IF p_size < 1 THEN
+        RAISE EXCEPTION 'block size must be positive: %', p_size;
+    END IF;
+
+    INSERT INTO work_orders.number_counters AS c (prefix, year, next_value)
+    VALUES (p_prefix, p_year, 1 + p_size)
+    ON CONFLICT (prefix, year)
+    DO UPDATE SET next_value = c.next_value + p_size, updated_at = CURRENT_TIMESTAMP
+    RETURNING next_value INTO block_end;
+
+    IF block_end - 1 >= 10000000 THEN
+        RAISE EXCEPTION 'number range of shard % exhausted for %-%', number_shard_index(), p_prefix, p_year;
+    END IF;
+
+    RETURN number_shard_index()::BIGINT * 10000000 + block_end - p_size;
+END;
+$$ LANGUAGE plpgsql;
+
+-- تنسيق الرقم: PREFIX-YYYY-NNNNNN (بدون قص الأرقام الأطول من 6 خانات)
+CREATE OR REPLACE FUNCTION format_document_number(p_prefix TEXT, p_year INTEGER, p_value BIGINT)
+RETURNS TEXT AS $$
+    SELECT p_prefix || '-' || p_year::TEXT || '-' ||
+           CASE WHEN p_value < 1000000 THEN LPAD(p_value::TEXT, 6, '0') ELSE p_value::TEXT END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- نقل العدادات من البيانات الموجودة (مرة واحدة)
+-- Counters are local to the shard's range, so numbers from it are counted without the offset
+INSERT INTO work_orders.number_counters (prefix, year, next_value)
+SELECT prefix, year, MAX(value - number_shard_index()::BIGINT * 10000000) + 1
+FROM (
+    SELECT 'WO' AS prefix, split_part(order_number, '-', 2)::SMALLINT AS year,
+           split_part(order_number, '-', 3)::BIGINT AS value
+    FROM work_orders.work_orders WHERE order_number ~ '^WO-[0-9]{4}-[0-9]+$'
+    UNION ALL
+    SELECT 'INSP', split_part(inspection_number, '-', 2)::SMALLINT, split_part(inspection_number, '-', 3)::BIGINT
+    FROM work_orders.inspections WHERE inspection_number ~ '^INSP-[0-9]{4}-[0-9]+$'
+    UNION ALL
+    SELECT 'QUOTE', split_part(quote_number, '-', 2)::SMALLINT, split_part(quote_number, '-', 3)::BIGINT
+    FROM work_orders.quotes WHERE quote_number ~ '^QUOTE-[0-9]{4}-[0-9]+$'
+) existing
+WHERE value - number_shard_index()::BIGINT * 10000000 BETWEEN 1 AND 9999999
+GROUP BY prefix, year
+ON CONFLICT (prefix, year) DO UPDATE SET next_value = GREATEST(work_orders.number_counters.next_value, EXCLUDED.next_value);
+
+-- الدوال القديمة تستخدم العدادات (تبقى المشغلات كما هي للإدخالات بدون رقم)
+CREATE OR REPLACE FUNCTION generate_work_order_number()
+RETURNS TEXT AS $$
+DECLARE
+    current_year INTEGER := EXTRACT(YEAR FROM CURRENT_DATE);
+BEGIN
+    RETURN format_document_number('WO', current_year, allocate_number_block('WO', current_year, 1));
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION generate_inspection_number()
+RETURNS TEXT AS $$
+DECLARE
+    current_year INTEGER := EXTRACT(YEAR FROM CURRENT_DATE);
+BEGIN
+    RETURN format_document_number('INSP', current_year, allocate_number_block('INSP', current_year, 1));
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION generate_quote_number()
+RETURNS TEXT AS $$
+DECLARE
+    current_year INTEGER := EXTRACT(YEAR FROM CURRENT_DATE);
+BEGIN
+    RETURN format_document_number('QUOTE', current_year, allocate_number_block('QUOTE', current_year, 1));
+END;
+$$ LANGUAGE plpgsql;
+
+-- منح الصلاحيات
+GRANT ALL PRIVILEGES ON work_orders.number_counters TO yaman_user;
+GRANT SELECT ON work_orders.number_shard TO yaman_user;
+GRANT EXECUTE ON FUNCTION number_shard_index() TO yaman_user;
+GRANT EXECUTE ON FUNCTION allocate_number_block(TEXT, INTEGER, INTEGER) TO yaman_user;
+GRANT EXECUTE ON FUNCTION format_document_number(TEXT, INTEGER, BIGINT) TO yaman_user;
+
+-- إظهار رسالة نجاح
+DO $$
+BEGIN
+    RAISE NOTICE 'تم إعداد عدادات الأرقام بنجاح - Number counters setup completed successfully';
+END $$;
@@ -0,0 +1,137 @@
+-- تقسيم سجل التدقيق حسب الشهر
+-- Monthly range partitioning for audit_logs.audit_trail
+
+-- الجدول القديم (غير مقسم) يُعاد تسميته ثم تُنقل بياناته
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'audit_logs' AND c.relname = 'audit_trail' AND c.relkind = 'r'
+    ) THEN
+        ALTER TABLE audit_logs.audit_trail RENAME TO audit_trail_legacy;
+        ALTER INDEX IF EXISTS audit_logs.idx_audit_trail_table_name RENAME TO idx_audit_trail_legacy_table_name;
+        ALTER INDEX IF EXISTS audit_logs.idx_audit_trail_operation RENAME TO idx_audit_trail_legacy_operation;
+        ALTER INDEX IF EXISTS audit_logs.idx_audit_trail_user_id RENAME TO idx_audit_trail_legacy_user_id;
+        ALTER INDEX IF EXISTS audit_logs.idx_audit_trail_timestamp RENAME TO idx_audit_trail_legacy_timestamp;
+    END IF;
+END $$;
+
+-- الجدول المقسم: المفتاح الأساسي يجب أن يتضمن عمود التقسيم
+CREATE TABLE IF NOT EXISTS audit_logs.audit_trail (
+    id BIGSERIAL,
+    table_name VARCHAR(100) NOT NULL,
+    operation VARCHAR(20) NOT NULL, -- INSERT, UPDATE, DELETE
+    record_id INTEGER,
+    old_values JSONB,
+    new_values JSONB,
+    user_id INTEGER,
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    ip_address INET,
+    user_agent TEXT,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- الفهارس تُنشأ على كل قسم تلقائياً
+-- Append-only by time: BRIN stays tiny; entity and user history are the real lookups
+CREATE INDEX IF NOT EXISTS idx_audit_trail_timestamp ON audit_logs.audit_trail USING BRIN (timestamp);
+CREATE INDEX IF NOT EXISTS idx_audit_trail_record ON audit_logs.audit_trail(table_name, record_id, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_audit_trail_user ON audit_logs.audit_trail(user_id, timestamp DESC) WHERE user_id IS NOT NULL;
+
+-- إنشاء قسم الشهر (بتوقيت UTC) إن لم يكن موجوداً
+CREATE OR REPLACE FUNCTION audit_logs.create_audit_partition(p_month DATE)
+RETURNS TEXT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', p_month)::DATE;
+    partition_name TEXT := 'audit_trail_p' || to_char(month_start, 'YYYYMM');
+BEGIN
+    IF to_regclass('audit_logs.' || partition_name) IS NULL THEN
+        -- Writers in several services may race to create the same month
+        PERFORM pg_advisory_xact_lock(hashtext('audit_logs.audit_trail partitions'));
+        IF to_regclass('audit_logs.' || partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE audit_logs.%I PARTITION OF audit_logs.audit_trail FOR VALUES FROM (%L) TO (%L)',
+                partition_name,
+                month_start::TIMESTAMP AT TIME ZONE 'UTC',
+                (month_start + INTERVAL '1 month')::TIMESTAMP AT TIME ZONE 'UTC'
+            );
+        END IF;
+    END IF;
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- إنشاء أقسام الشهر الحالي والأشهر القادمة
+CREATE OR REPLACE FUNCTION audit_logs.ensure_audit_partitions(p_from DATE DEFAULT CURRENT_DATE, p_months_ahead INTEGER DEFAULT 3)
+RETURNS SETOF TEXT AS $$
+BEGIN
+    FOR i IN 0..p_months_ahead LOOP
+        RETURN NEXT audit_logs.create_audit_partition((p_from + make_interval(months => i))::DATE);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- فصل/حذف الأقسام الأقدم من فترة الاحتفاظ
+-- Keeps the current month plus p_retention_months full months before it.
+-- With p_drop = FALSE partitions are only detached (e.g. to dump them first).
+CREATE OR REPLACE FUNCTION audit_logs.drop_expired_audit_partitions(p_retention_months INTEGER, p_drop BOOLEAN DEFAULT TRUE)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    cutoff DATE := (date_trunc('month', now() AT TIME ZONE 'UTC') - make_interval(months => p_retention_months))::DATE;
+    partition_name TEXT;
+BEGIN
+    FOR partition_name IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'audit_logs.audit_trail'::regclass
+          AND c.relname ~ '^audit_trail_p[0-9]{6}$'
+          AND to_date(substring(c.relname FROM 14), 'YYYYMM') < cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE audit_logs.audit_trail DETACH PARTITION audit_logs.%I', partition_name);
+        IF p_drop THEN
+            EXECUTE format('DROP TABLE audit_logs.%I', partition_name);
+        END IF;
+        RETURN NEXT partition_name;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- نقل البيانات القديمة إلى الأقسام
+DO $$
+DECLARE
+    legacy_month DATE;
+BEGIN
+    IF to_regclass('audit_logs.audit_trail_legacy') IS NOT NULL THEN
+        FOR legacy_month IN
+            SELECT DISTINCT date_trunc('month', COALESCE(timestamp, now()) AT TIME ZONE 'UTC')::DATE
+            FROM audit_logs.audit_trail_legacy
+        LOOP
+            PERFORM audit_logs.create_audit_partition(legacy_month);
+        END LOOP;
+
+        INSERT INTO audit_logs.audit_trail (
+            id, table_name, operation, record_id, old_values, new_values, user_id, timestamp, ip_address, user_agent
+        )
+        SELECT id, table_name, operation, record_id, old_values, new_values, user_id,
+               COALESCE(timestamp, now()), ip_address, user_agent
+        FROM audit_logs.audit_trail_legacy;
+
+        PERFORM setval(pg_get_serial_sequence('audit_logs.audit_trail', 'id'),
+                       COALESCE((SELECT MAX(id) FROM audit_logs.audit_trail), 0) + 1, FALSE);
+        DROP TABLE audit_logs.audit_trail_legacy;
+    END IF;
+END $$;
+
+SELECT audit_logs.ensure_audit_partitions(CURRENT_DATE, 3);
+
+-- منح الصلاحيات
+GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA audit_logs TO yaman_user;
+GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA audit_logs TO yaman_user;
+ALTER DEFAULT PRIVILEGES IN SCHEMA audit_logs GRANT ALL PRIVILEGES ON TABLES TO yaman_user;
+
+-- إظهار رسالة نجاح
+DO $$
+BEGIN
+    RAISE NOTICE 'تم إعداد تقسيم سجل التدقيق بنجاح - Audit trail partitioning setup completed successfully';
+END $$;
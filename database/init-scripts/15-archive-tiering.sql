@@ -0,0 +1,89 @@
+-- أرشفة أوامر العمل والرسائل والإشعارات القديمة
+-- Archive tier for closed work orders, their chat history and old notifications
+--
+-- Rows are moved (not copied) by `python -m shared.archiver run`, keeping their
+-- ids, so the hot tables and their indexes only hold live history. The archive
+-- tables are plain copies of the hot ones plus archived_at; they carry no
+-- foreign keys and are read only through the detail endpoints' fallback.
+
+CREATE SCHEMA IF NOT EXISTS archive;
+
+-- أوامر العمل وجداولها الفرعية
+CREATE TABLE IF NOT EXISTS archive.work_orders (LIKE work_orders.work_orders INCLUDING DEFAULTS);
+CREATE TABLE IF NOT EXISTS archive.work_order_services (LIKE work_orders.work_order_services INCLUDING DEFAULTS);
+CREATE TABLE IF NOT EXISTS archive.work_order_parts (LIKE work_orders.work_order_parts INCLUDING DEFAULTS);
+CREATE TABLE IF NOT EXISTS archive.work_order_tasks (LIKE work_orders.work_order_tasks INCLUDING DEFAULTS);
+CREATE TABLE IF NOT EXISTS archive.work_order_status_history (LIKE work_orders.work_order_status_history INCLUDING DEFAULTS);
+CREATE TABLE IF NOT EXISTS archive.work_order_comments (LIKE work_orders.work_order_comments INCLUDING DEFAULTS);
+CREATE TABLE IF NOT EXISTS archive.work_order_images (LIKE work_orders.work_order_images INCLUDING DEFAULTS);
+
+-- الرسائل (تُنقل غرفة كاملة في كل مرة)
+CREATE TABLE IF NOT EXISTS archive.messages (LIKE chat_system.messages INCLUDING DEFAULTS);
+CREATE TABLE IF NOT EXISTS archive.message_attachments (LIKE chat_system.message_attachments INCLUDING DEFAULTS);
+CREATE TABLE IF NOT EXISTS archive.message_reactions (LIKE chat_system.message_reactions INCLUDING DEFAULTS);
+
+-- الإشعارات المرسلة
+CREATE TABLE IF NOT EXISTS archive.notifications (LIKE work_orders.notifications INCLUDING DEFAULTS);
+
+-- Sequence defaults must not point at the hot sequences: archived rows keep their ids
+DO $$
+DECLARE
+    archive_table TEXT;
+BEGIN
+    FOREACH archive_table IN ARRAY ARRAY[
+        'work_orders', 'work_order_services', 'work_order_parts', 'work_order_tasks',
+        'work_order_status_history', 'work_order_comments', 'work_order_images',
+        'messages', 'message_attachments', 'message_reactions', 'notifications'
+    ] LOOP
+        EXECUTE format('ALTER TABLE archive.%I ALTER COLUMN id DROP DEFAULT', archive_table);
+        EXECUTE format(
+            'ALTER TABLE archive.%I ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP',
+            archive_table
+        );
+        EXECUTE format('CREATE UNIQUE INDEX IF NOT EXISTS %I ON archive.%I(id)', 'idx_archive_' || archive_table || '_id', archive_table);
+    END LOOP;
+END $$;
+
+-- فهارس القراءة من الأرشيف
+CREATE INDEX IF NOT EXISTS idx_archive_work_orders_order_number ON archive.work_orders(order_number);
+CREATE INDEX IF NOT EXISTS idx_archive_work_orders_customer ON archive.work_orders(customer_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_archive_work_order_services_wo ON archive.work_order_services(work_order_id);
+CREATE INDEX IF NOT EXISTS idx_archive_work_order_parts_wo ON archive.work_order_parts(work_order_id);
+CREATE INDEX IF NOT EXISTS idx_archive_work_order_tasks_wo ON archive.work_order_tasks(work_order_id);
+CREATE INDEX IF NOT EXISTS idx_archive_work_order_status_history_wo ON archive.work_order_status_history(work_order_id);
+CREATE INDEX IF NOT EXISTS idx_archive_work_order_comments_wo ON archive.work_order_comments(work_order_id);
+CREATE INDEX IF NOT EXISTS idx_archive_work_order_images_wo ON archive.work_order_images(work_order_id);
+CREATE INDEX IF NOT EXISTS idx_archive_messages_room_created_id ON archive.messages(room_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_archive_message_attachments_message ON archive.message_attachments(message_id);
+CREATE INDEX IF NOT EXISTS idx_archive_message_reactions_message ON archive.message_reactions(message_id);
+CREATE INDEX IF NOT EXISTS idx_archive_notifications_recipient ON archive.notifications(recipient_id, created_at DESC);
+
+-- الغرف المؤرشفة تبقى في الجدول الساخن؛ رسائلها في الأرشيف
+ALTER TABLE chat_system.chat_rooms ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP WITH TIME ZONE;
+
+-- المراجع التي لا تتبع الحذف تمنع نقل أمر العمل؛ المعرفات ثابتة عبر الطبقتين
+-- These references outlive the work order in the hot tables (inspections,
+-- quotes, chat rooms); ids are stable across tiers, so they stay valid.
+ALTER TABLE work_orders.inspections DROP CONSTRAINT IF EXISTS inspections_converted_to_work_order_id_fkey;
+ALTER TABLE work_orders.quotes DROP CONSTRAINT IF EXISTS quotes_work_order_id_fkey;
+ALTER TABLE chat_system.chat_rooms DROP CONSTRAINT IF EXISTS chat_rooms_work_order_id_fkey;
+
+-- فهارس جزئية للمرشحين للأرشفة حتى لا يمسح النقل الجداول الساخنة
+CREATE INDEX IF NOT EXISTS idx_work_orders_archivable
+    ON work_orders.work_orders((COALESCE(closed_at, completed_at, updated_at)), id)
+    WHERE status IN ('Completed', 'Cancelled');
+CREATE INDEX IF NOT EXISTS idx_notifications_archivable
+    ON work_orders.notifications(created_at, id)
+    WHERE status IN ('Sent', 'Delivered', 'Read', 'Failed') AND held_for_digest = FALSE;
+CREATE INDEX IF NOT EXISTS idx_chat_rooms_work_order ON chat_system.chat_rooms(work_order_id) WHERE archived_at IS NULL;
+
+-- منح الصلاحيات
+GRANT USAGE ON SCHEMA archive TO yaman_user;
+GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA archive TO yaman_user;
+ALTER DEFAULT PRIVILEGES IN SCHEMA archive GRANT ALL PRIVILEGES ON TABLES TO yaman_user;
+
+-- إظهار رسالة نجاح
+DO $$
+BEGIN
+    RAISE NOTICE 'تم إعداد طبقة الأرشيف بنجاح - Archive tier setup completed successfully';
+END $$;
@@ -0,0 +1,93 @@
+-- الفروع: مفتاح الفرع على الجداول الأساسية وعزل البيانات بين الفروع
+-- Branch key on the core tables, branch-scoped row security
+--
+-- Every shard runs these scripts and keeps the same branches directory; which
+-- shard holds a branch's rows is configured in the services (BRANCH_SHARDS).
+-- Sessions select their branch with set_config('yaman.branch_id', ...); rows
+-- inserted without a branch_id take it from there. Without the setting (jobs,
+-- cross-branch reports) every branch is visible.
+
+CREATE TABLE IF NOT EXISTS user_management.branches (
+    id SERIAL PRIMARY KEY,
+    code VARCHAR(20) UNIQUE NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    name_ar VARCHAR(255),
+    is_active BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- الفرع الافتراضي لكل البيانات الموجودة
+INSERT INTO user_management.branches (id, code, name, name_ar)
+VALUES (1, 'MAIN', 'Main workshop', 'الورشة الرئيسية')
+ON CONFLICT (id) DO NOTHING;
+SELECT setval(pg_get_serial_sequence('user_management.branches', 'id'),
+              GREATEST((SELECT MAX(id) FROM user_management.branches), 1));
+
+-- الفرع المحدد للجلسة الحالية (NULL = كل الفروع)
+CREATE OR REPLACE FUNCTION current_branch_id()
+RETURNS INTEGER AS $$
+    SELECT NULLIF(current_setting('yaman.branch_id', true), '')::INTEGER;
+$$ LANGUAGE sql STABLE;
+
+-- An array rather than "setting IS NULL OR branch_id = setting", so the
+-- policy stays an index condition on (branch_id, ...)
+CREATE OR REPLACE FUNCTION branch_scope()
+RETURNS INTEGER[] AS $$
+    SELECT CASE
+        WHEN current_branch_id() IS NULL THEN ARRAY(SELECT id FROM user_management.branches)
+        ELSE ARRAY[current_branch_id()]
+    END;
+$$ LANGUAGE sql STABLE;
+
+-- إضافة مفتاح الفرع والفهارس وسياسة العزل
+DO $$
+DECLARE
+    scoped_table TEXT;
+BEGIN
+    FOREACH scoped_table IN ARRAY ARRAY[
+        'user_management.users', 'work_orders.work_orders', 'work_orders.inspections',
+        'work_orders.quotes', 'work_orders.notifications', 'chat_system.chat_rooms'
+    ] LOOP
+        EXECUTE format(
+            'ALTER TABLE %s ADD COLUMN IF NOT EXISTS branch_id INTEGER NOT NULL DEFAULT COALESCE(current_branch_id(), 1) REFERENCES user_management.branches(id)',
+            scoped_table
+        );
+        EXECUTE format(
+            'CREATE INDEX IF NOT EXISTS %I ON %s(branch_id, created_at DESC)',
+            'idx_' || split_part(scoped_table, '.', 2) || '_branch_created', scoped_table
+        );
+        EXECUTE format('ALTER TABLE %s ENABLE ROW LEVEL SECURITY', scoped_table);
+        -- Table owners are subject to the policy too; superusers never are
+        EXECUTE format('ALTER TABLE %s FORCE ROW LEVEL SECURITY', scoped_table);
+        EXECUTE format('DROP POLICY IF EXISTS branch_isolation ON %s', scoped_table);
+        EXECUTE format(
+            'CREATE POLICY branch_isolation ON %s USING (branch_id = ANY(branch_scope())) WITH CHECK (branch_id = ANY(branch_scope()))',
+            scoped_table
+        );
+    END LOOP;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_users_branch_role ON user_management.users(branch_id, role) WHERE is_active = TRUE;
+CREATE INDEX IF NOT EXISTS idx_work_orders_branch_status ON work_orders.work_orders(branch_id, status);
+
+-- الأرشيف يحتفظ بفرع كل سجل
+DO $$
+BEGIN
+    IF to_regclass('archive.work_orders') IS NOT NULL THEN
+        ALTER TABLE archive.work_orders ADD COLUMN IF NOT EXISTS branch_id INTEGER;
+        ALTER TABLE archive.notifications ADD COLUMN IF NOT EXISTS branch_id INTEGER;
+        CREATE INDEX IF NOT EXISTS idx_archive_work_orders_branch ON archive.work_orders(branch_id, created_at DESC);
+    END IF;
+END $$;
+
+-- منح الصلاحيات
+GRANT ALL PRIVILEGES ON user_management.branches TO yaman_user;
+GRANT USAGE, SELECT ON SEQUENCE user_management.branches_id_seq TO yaman_user;
+GRANT EXECUTE ON FUNCTION current_branch_id() TO yaman_user;
+GRANT EXECUTE ON FUNCTION branch_scope() TO yaman_user;
+
+-- إظهار رسالة نجاح
+DO $$
+BEGIN
+    RAISE NOTICE 'تم إعداد الفروع بنجاح - Branches setup completed successfully';
+END $$;
@@ -0,0 +1,124 @@
+-- مزامنة تطبيق الجوال دون اتصال
+-- Delta sync for the mobile app: change versions, tombstones, idempotent mutations
+--
+-- Clients pull rows changed since their cursor, ordered by (updated_at, id),
+-- plus tombstones for deleted rows, and push offline edits tagged with an
+-- idempotency key (see delta_sync.py).
+
+-- updated_at على الجداول التي لا تملكه
+ALTER TABLE work_orders.inspection_faults ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP;
+DROP TRIGGER IF EXISTS update_inspection_faults_updated_at ON work_orders.inspection_faults;
+CREATE TRIGGER update_inspection_faults_updated_at
+    BEFORE UPDATE ON work_orders.inspection_faults
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- inspection_photos is created by the application models
+DO $$
+BEGIN
+    IF to_regclass('work_orders.inspection_photos') IS NOT NULL THEN
+        ALTER TABLE work_orders.inspection_photos ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP;
+        DROP TRIGGER IF EXISTS update_inspection_photos_updated_at ON work_orders.inspection_photos;
+        CREATE TRIGGER update_inspection_photos_updated_at
+            BEFORE UPDATE ON work_orders.inspection_photos
+            FOR EACH ROW
+            EXECUTE FUNCTION update_updated_at_column();
+        CREATE INDEX IF NOT EXISTS idx_inspection_photos_sync ON work_orders.inspection_photos(updated_at, id);
+    END IF;
+END $$;
+
+-- فهارس المزامنة: الصفوف المتغيرة بعد المؤشر
+CREATE INDEX IF NOT EXISTS idx_work_orders_sync ON work_orders.work_orders(updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_work_order_tasks_sync ON work_orders.work_order_tasks(updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_inspections_sync ON work_orders.inspections(updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_inspection_faults_sync ON work_orders.inspection_faults(updated_at, id);
+
+-- شواهد الحذف
+CREATE TABLE IF NOT EXISTS work_orders.sync_tombstones (
+    id BIGSERIAL PRIMARY KEY,
+    table_name VARCHAR(50) NOT NULL,
+    record_id INTEGER NOT NULL,
+    branch_id INTEGER, -- NULL: sent to every branch
+    deleted_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_deleted ON work_orders.sync_tombstones(deleted_at, id);
+
+-- نقل الأرشيف (shared/archiver.py) ليس حذفاً: الصفوف المؤرشفة ما زالت تُقرأ
+-- Archive moves are not deletes: the archiver sets yaman.archiving for its transaction
+CREATE OR REPLACE FUNCTION record_sync_tombstone()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF current_setting('yaman.archiving', true) = 'on' THEN
+        RETURN OLD;
+    END IF;
+    INSERT INTO work_orders.sync_tombstones (table_name, record_id, branch_id)
+    VALUES (TG_TABLE_NAME, OLD.id, COALESCE((to_jsonb(OLD)->>'branch_id')::INTEGER, current_branch_id()));
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    synced_table TEXT;
+BEGIN
+    FOREACH synced_table IN ARRAY ARRAY[
+        'work_orders', 'work_order_tasks', 'inspections', 'inspection_faults', 'inspection_photos'
+    ] LOOP
+        IF to_regclass('work_orders.' || synced_table) IS NOT NULL THEN
+            EXECUTE format('DROP TRIGGER IF EXISTS %I ON work_orders.%I', synced_table || '_sync_tombstone', synced_table);
+            EXECUTE format(
+                'CREATE TRIGGER %I AFTER DELETE ON work_orders.%I FOR EACH ROW EXECUTE FUNCTION record_sync_tombstone()',
+                synced_table || '_sync_tombstone', synced_table
+            );
+        END IF;
+    END LOOP;
+END $$;
+
+-- حذف الشواهد الأقدم من فترة الاحتفاظ؛ العملاء الأقدم منها يعيدون المزامنة كاملة
+CREATE OR REPLACE FUNCTION purge_sync_tombstones(p_days INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    purged INTEGER;
+BEGIN
+    DELETE FROM work_orders.sync_tombstones WHERE deleted_at < now() - make_interval(days => p_days);
+    GET DIAGNOSTICS purged = ROW_COUNT;
+    RETURN purged;
+END;
+$$ LANGUAGE plpgsql;
+
+-- التعديلات المطبقة من الأجهزة (مفتاح منع التكرار)
+CREATE TABLE IF NOT EXISTS work_orders.sync_mutations (
+    idempotency_key VARCHAR(100) PRIMARY KEY,
+    device_id VARCHAR(100) NOT NULL,
+    status VARCHAR(20) NOT NULL, -- pending, applied, conflict, not_found, rejected
+    result JSONB,
+    applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_mutations_applied ON work_orders.sync_mutations(applied_at);
+
+-- حذف مفاتيح التعديلات الأقدم من فترة الاحتفاظ
+CREATE OR REPLACE FUNCTION purge_sync_mutations(p_days INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    purged INTEGER;
+BEGIN
+    DELETE FROM work_orders.sync_mutations WHERE applied_at < now() - make_interval(days => p_days);
+    GET DIAGNOSTICS purged = ROW_COUNT;
+    RETURN purged;
+END;
+$$ LANGUAGE plpgsql;
+
+-- منح الصلاحيات
+GRANT ALL PRIVILEGES ON work_orders.sync_tombstones TO yaman_user;
+GRANT ALL PRIVILEGES ON work_orders.sync_mutations TO yaman_user;
+GRANT USAGE, SELECT ON SEQUENCE work_orders.sync_tombstones_id_seq TO yaman_user;
+GRANT EXECUTE ON FUNCTION purge_sync_tombstones(INTEGER) TO yaman_user;
+GRANT EXECUTE ON FUNCTION purge_sync_mutations(INTEGER) TO yaman_user;
+
+-- إظهار رسالة نجاح
+DO $$
+BEGIN
+    RAISE NOTICE 'تم إعداد المزامنة دون اتصال بنجاح - Offline sync setup completed successfully';
+END $$;
@@ -0,0 +1,65 @@
+-- مفاتيح منع تكرار الطلبات
+-- Idempotency keys: stored responses of write requests sent with an Idempotency-Key header
+--
+-- Keys and request fingerprints are stored as SHA-256 digests, only the
+-- response headers worth replaying are kept, and a row is written twice at
+-- most (claim, then response), so the table stays small and updates stay HOT.
+-- See shared/idempotency.py.
+
+CREATE TABLE IF NOT EXISTS work_orders.idempotency_keys (
+    key_hash BYTEA PRIMARY KEY,          -- service, caller, branch and key
+    fingerprint BYTEA NOT NULL,          -- method, path, query and body
+    status_code SMALLINT,                -- NULL while the first request is running
+    headers JSONB,
+    body BYTEA,
+    locked_until TIMESTAMP WITH TIME ZONE,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+) WITH (fillfactor = 90);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON work_orders.idempotency_keys(expires_at);
+
+-- حجز المفتاح للطلب الأول؛ المفاتيح المنتهية أو المتروكة يعاد استخدامها
+CREATE OR REPLACE FUNCTION claim_idempotency_key(p_key BYTEA, p_fingerprint BYTEA, p_lock_seconds INTEGER)
+RETURNS BOOLEAN AS $$
+DECLARE
+    claimed BOOLEAN;
+BEGIN
+    INSERT INTO work_orders.idempotency_keys AS k (key_hash, fingerprint, locked_until, expires_at)
+    VALUES (p_key, p_fingerprint, now() + make_interval(secs => p_lock_seconds),
+            now() + make_interval(secs => p_lock_seconds))
+    ON CONFLICT (key_hash) DO UPDATE
+        SET fingerprint = EXCLUDED.fingerprint,
+            status_code = NULL,
+            headers = NULL,
+            body = NULL,
+            locked_until = EXCLUDED.locked_until,
+            expires_at = EXCLUDED.expires_at
+        -- Expired responses, and claims whose worker died before answering
+        WHERE k.expires_at < now() OR (k.status_code IS NULL AND k.locked_until < now())
+    RETURNING TRUE INTO claimed;
+    RETURN COALESCE(claimed, FALSE);
+END;
+$$ LANGUAGE plpgsql;
+
+-- حذف الاستجابات المنتهية
+CREATE OR REPLACE FUNCTION purge_idempotency_keys()
+RETURNS INTEGER AS $$
+DECLARE
+    purged INTEGER;
+BEGIN
+    DELETE FROM work_orders.idempotency_keys WHERE expires_at < now();
+    GET DIAGNOSTICS purged = ROW_COUNT;
+    RETURN purged;
+END;
+$$ LANGUAGE plpgsql;
+
+-- منح الصلاحيات
+GRANT ALL PRIVILEGES ON work_orders.idempotency_keys TO yaman_user;
+GRANT EXECUTE ON FUNCTION claim_idempotency_key(BYTEA, BYTEA, INTEGER) TO yaman_user;
+GRANT EXECUTE ON FUNCTION purge_idempotency_keys() TO yaman_user;
+
+-- إظهار رسالة نجاح
+DO $$
+BEGIN
+    RAISE NOTICE 'تم إعداد مفاتيح منع التكرار بنجاح - Idempotency keys setup completed successfully';
+END $$;
@@ -0,0 +1,28 @@
+-- الاستيراد الجماعي: مفتاح طبيعي لأنواع المركبات
+-- Bulk import: natural key for vehicle types
+--
+-- bulk_import.py upserts vehicle types with ON CONFLICT on the same
+-- expressions; services (service_code) and customers (email) already have
+-- unique keys. Existing duplicates must be merged before the index can be
+-- built, since inspections may reference any of them.
+
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM work_orders.vehicle_types
+        GROUP BY lower(make), lower(model), COALESCE(year, 0), lower(COALESCE(trim_level, ''))
+        HAVING count(*) > 1
+    ) THEN
+        RAISE WARNING 'أنواع مركبات مكررة - duplicate vehicle types found; merge them and run this script again';
+    ELSE
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_vehicle_types_natural_key ON work_orders.vehicle_types (
+            lower(make), lower(model), COALESCE(year, 0), lower(COALESCE(trim_level, ''))
+        );
+    END IF;
+END $$;
+
+-- إظهار رسالة نجاح
+DO $$
+BEGIN
+    RAISE NOTICE 'تم إعداد الاستيراد الجماعي بنجاح - Bulk import setup completed successfully';
+END $$;
@@ -0,0 +1,37 @@
+-- ذاكرة دليل الخدمات: تنبيه عند تغيير الدليل
+-- Service catalog cache: notify on catalog changes
+--
+-- shared/catalog.py keeps categories, services, pricing tiers and
+-- specifications in memory and reloads them when it hears catalog_changed.
+-- One notification per statement (a bulk import is one statement per table),
+-- delivered after the transaction commits; the table name is the payload.
+
+CREATE OR REPLACE FUNCTION service_catalog.notify_catalog_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('catalog_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS catalog_changed ON service_catalog.service_categories;
+CREATE TRIGGER catalog_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON service_catalog.service_categories
+    FOR EACH STATEMENT EXECUTE FUNCTION service_catalog.notify_catalog_changed();
+
+DROP TRIGGER IF EXISTS catalog_changed ON service_catalog.services;
+CREATE TRIGGER catalog_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON service_catalog.services
+    FOR EACH STATEMENT EXECUTE FUNCTION service_catalog.notify_catalog_changed();
+
+DROP TRIGGER IF EXISTS catalog_changed ON service_catalog.service_pricing;
+CREATE TRIGGER catalog_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON service_catalog.service_pricing
+    FOR EACH STATEMENT EXECUTE FUNCTION service_catalog.notify_catalog_changed();
+
+DROP TRIGGER IF EXISTS catalog_changed ON service_catalog.service_specifications;
+CREATE TRIGGER catalog_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON service_catalog.service_specifications
+    FOR EACH STATEMENT EXECUTE FUNCTION service_catalog.notify_catalog_changed();
+
+-- إظهار رسالة نجاح
+DO $$
+BEGIN
+    RAISE NOTICE 'تم إعداد تنبيهات دليل الخدمات بنجاح - Service catalog notifications setup completed successfully';
+END $$;
@@ -0,0 +1,338 @@
+"""
+Offline delta sync for the mobile app - مزامنة تطبيق الجوال دون اتصال
+
+Pull: the app keeps an opaque cursor and asks for what changed since it:
+
+    GET /api/v1/sync/changes?cursor=...&limit=500
+
+Rows of each synced table are returned in (updated_at, id) order as compact
+column/row arrays, followed by tombstones of deleted rows. The app stores the
+returned cursor and repeats while has_more is true. Without a cursor the
+first pages are a full snapshot (no tombstones needed). A cursor older than
+SYNC_TOMBSTONE_DAYS gets reset=true: tombstones it relied on may be purged,
+so the app drops its copy and starts again without a cursor.
+
+Only rows last changed more than SYNC_SETTLE_SECONDS ago are returned, so a
+transaction that commits just after a page was read cannot slip in behind
+the cursor; write transactions are assumed to be shorter than that.
+
+Push: offline edits are sent in batches, each with a client-generated
+idempotency key and, for updates and deletes, the updated_at the edit was
+based on. A row changed on the server since then is a conflict and its
+current version is returned instead; a key already seen returns the stored
+result (replayed=true), so resending a batch after a lost response is safe.
+
+Scoping follows the session: rows of other branches are never returned or
+touched (see database.py).
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import base64
+import json
+import os
+
+from pydantic import BaseModel, Field
+from sqlalchemy import or_, text, tuple_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from models import (
+    INSPECTION_STATUSES,
+    Inspection,
+    InspectionFault,
+    InspectionPhoto,
+    SyncMutation as SyncMutationRecord,
+    SyncTombstone,
+    WorkOrder,
+    WorkOrderTask,
+)
+from serializers import dumps
+
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "500"))
+SYNC_MAX_PAGE_SIZE = int(os.getenv("SYNC_MAX_PAGE_SIZE", "2000"))
+SYNC_SETTLE_SECONDS = float(os.getenv("SYNC_SETTLE_SECONDS", "5"))
+SYNC_TOMBSTONE_DAYS = int(os.getenv("SYNC_TOMBSTONE_DAYS", "90"))
+SYNC_MAX_MUTATIONS = int(os.getenv("SYNC_MAX_MUTATIONS", "200"))
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class SyncTable:
+    """A table the app mirrors, and which of its fields the app may change."""
+
+    def __init__(self, name: str, model, parent=None, updatable: Tuple[str, ...] = (),
+                 creatable: Tuple[str, ...] = (), deletable: bool = False):
+        self.name = name
+        self.model = model
+        # Rows without a branch_id are scoped through their parent's
+        self.parent = parent
+        self.updatable = frozenset(updatable)
+        self.creatable = frozenset(creatable)
+        self.deletable = deletable
+        self.columns = [column.key for column in model.__mapper__.column_attrs]
+
+    def query(self, db: Session, *entities):
+        query = db.query(*entities)
+        if self.parent is not None:
+            parent_model, key = self.parent
+            query = query.join(parent_model, parent_model.id == getattr(self.model, key))
+        return query
+
+
+FAULT_FIELDS = (
+    "category", "fault_code", "description", "severity", "location", "estimated_cost", "estimated_duration",
+    "requires_immediate_attention", "is_safety_critical", "recommended_action", "notes",
+)
+
+# Parents first, so a page never holds a child whose parent the app has not seen
+SYNC_TABLES: Dict[str, SyncTable] = {table.name: table for table in (
+    SyncTable("work_orders", WorkOrder),
+    SyncTable("work_order_tasks", WorkOrderTask, parent=(WorkOrder, "work_order_id"),
+              updatable=("status", "actual_duration", "started_at", "completed_at", "notes")),
+    SyncTable("inspections", Inspection,
+              updatable=("status", "notes", "initial_assessment", "recommendations", "vehicle_mileage")),
+    SyncTable("inspection_faults", InspectionFault, parent=(Inspection, "inspection_id"),
+              updatable=FAULT_FIELDS, creatable=("uuid", "inspection_id", *FAULT_FIELDS), deletable=True),
+    # Photos are uploaded through /inspections/{id}/photos; only their metadata syncs back
+    SyncTable("inspection_photos", InspectionPhoto, parent=(Inspection, "inspection_id"),
+              updatable=("caption", "photo_type", "tags"), deletable=True),
+)}
+
+
+# Cursor ---------------------------------------------------------------------
+
+def encode_cursor(positions: Dict[str, Tuple[datetime, int]]) -> str:
+    raw = json.dumps({name: [at.isoformat(), row_id] for name, (at, row_id) in positions.items()},
+                     separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Dict[str, Tuple[datetime, int]]]:
+    """Positions per table (and "deleted" for tombstones); ValueError if malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return {name: (datetime.fromisoformat(at), int(row_id)) for name, (at, row_id) in raw.items()}
+    except Exception as exc:
+        raise ValueError("invalid sync cursor") from exc
+
+
+# Pull -----------------------------------------------------------------------
+
+def fetch_changes(db: Session, cursor: Optional[str], limit: int = SYNC_PAGE_SIZE) -> Dict[str, Any]:
+    positions = decode_cursor(cursor)
+    now = db.execute(text("SELECT now()")).scalar_one()
+    settled = now - timedelta(seconds=SYNC_SETTLE_SECONDS)
+
+    if positions is None:
+        # Fresh snapshot: everything current is included, so no tombstones before now
+        positions = {"deleted": (settled, 0)}
+    elif positions.get("deleted", (EPOCH, 0))[0] < now - timedelta(days=SYNC_TOMBSTONE_DAYS):
+        return {"reset": True, "cursor": None, "has_more": False, "tables": {}, "deleted": {}}
+
+    remaining = min(max(limit, 1), SYNC_MAX_PAGE_SIZE)
+    tables: Dict[str, Any] = {}
+    has_more = False
+
+    for name, table in SYNC_TABLES.items():
+        model = table.model
+        after = positions.get(name, (EPOCH, 0))
+        rows = table.query(db, *[getattr(model, column) for column in table.columns]).filter(
+            tuple_(model.updated_at, model.id) > after,
+            model.updated_at <= settled
+        ).order_by(model.updated_at, model.id).limit(remaining + 1).all()
+        if len(rows) > remaining:
+            rows, has_more = rows[:remaining], True
+        if rows:
+            tables[name] = {"columns": table.columns, "rows": [list(row) for row in rows]}
+            last = rows[-1]._mapping
+            positions[name] = (last["updated_at"], last["id"])
+            remaining -= len(rows)
+        if has_more:
+            break
+
+    deleted: Dict[str, List[int]] = {}
+    if not has_more:
+        branch_id = db.info.get("branch_id")
+        tombstones = db.query(
+            SyncTombstone.table_name, SyncTombstone.record_id, SyncTombstone.deleted_at, SyncTombstone.id
+        ).filter(
+            tuple_(SyncTombstone.deleted_at, SyncTombstone.id) > positions["deleted"],
+            SyncTombstone.deleted_at <= settled,
+            or_(SyncTombstone.branch_id.is_(None), SyncTombstone.branch_id == branch_id)
+        ).order_by(SyncTombstone.deleted_at, SyncTombstone.id).limit(remaining + 1).all()
+        if len(tombstones) > remaining:
+            tombstones, has_more = tombstones[:remaining], True
+        for table_name, record_id, _, _ in tombstones:
+            deleted.setdefault(table_name, []).append(record_id)
+        if tombstones:
+            positions["deleted"] = (tombstones[-1].deleted_at, tombstones[-1].id)
+
+    return {
+        "reset": False,
+        "cursor": encode_cursor(positions),
+        "has_more": has_more,
+        "tables": tables,
+        "deleted": deleted,
+    }
+
+
+# Push -----------------------------------------------------------------------
+
+class SyncMutationIn(BaseModel):
+    idempotency_key: str = Field(..., min_length=8, max_length=100)
+    table: str
+    op: str = Field(..., pattern="^(create|update|delete)$")
+    id: Optional[int] = None
+    base_updated_at: Optional[datetime] = None  # the version the offline edit started from
+    values: Dict[str, Any] = {}
+
+
+class SyncMutationBatch(BaseModel):
+    device_id: str = Field(..., min_length=1, max_length=100)
+    mutations: List[SyncMutationIn] = Field(..., max_length=SYNC_MAX_MUTATIONS)
+
+
+class SyncMutationResult(BaseModel):
+    idempotency_key: str
+    status: str  # applied, conflict, not_found, rejected
+    id: Optional[int] = None
+    updated_at: Optional[datetime] = None
+    current: Optional[Dict[str, Any]] = None  # server version, on conflict
+    error: Optional[str] = None
+    replayed: bool = False
+
+
+class _AlreadyClaimed(Exception):
+    pass
+
+
+def _row(table: SyncTable, instance) -> Dict[str, Any]:
+    # Same encoding as the rows the app pulls
+    return json.loads(dumps({column: getattr(instance, column) for column in table.columns}))
+
+
+def _validate(table: SyncTable, values: Dict[str, Any]) -> Optional[str]:
+    if table.model is Inspection and "status" in values and values["status"] not in INSPECTION_STATUSES:
+        return f"invalid status; allowed: {', '.join(INSPECTION_STATUSES)}"
+    return None
+
+
+def _apply(db: Session, table: SyncTable, mutation: SyncMutationIn) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"idempotency_key": mutation.idempotency_key, "id": mutation.id}
+
+    if mutation.op == "create":
+        fields = set(mutation.values) - table.creatable
+        if not table.creatable or fields:
+            return {**result, "status": "rejected", "error": f"cannot create {table.name} with {sorted(fields)}"}
+        error = _validate(table, mutation.values)
+        if error:
+            return {**result, "status": "rejected", "error": error}
+        if table.parent is not None:
+            parent_model, key = table.parent
+            # The parent must be visible to this session (same branch)
+            if db.query(parent_model.id).filter(parent_model.id == mutation.values.get(key)).first() is None:
+                return {**result, "status": "not_found", "error": f"{key} not found"}
+        instance = table.model(**mutation.values)
+        if hasattr(instance, "created_by"):
+            instance.created_by = 1
+        db.add(instance)
+        db.flush()
+        db.refresh(instance)
+        return {**result, "status": "applied", "id": instance.id, "updated_at": instance.updated_at}
+
+    instance = table.query(db, table.model).filter(table.model.id == mutation.id).with_for_update(
+        of=table.model
+    ).first()
+    if instance is None:
+        return {**result, "status": "not_found"}
+    if mutation.base_updated_at is None:
+        return {**result, "status": "rejected", "error": "base_updated_at is required"}
+    if instance.updated_at != mutation.base_updated_at:
+        return {**result, "status": "conflict", "updated_at": instance.updated_at, "current": _row(table, instance)}
+
+    if mutation.op == "delete":
+        if not table.deletable:
+            return {**result, "status": "rejected", "error": f"{table.name} cannot be deleted from the app"}
+        db.delete(instance)
+        db.flush()
+        return {**result, "status": "applied"}
+
+    fields = set(mutation.values) - table.updatable
+    if fields or not mutation.values:
+        return {**result, "status": "rejected", "error": f"cannot update {sorted(fields) or 'nothing'} on {table.name}"}
+    error = _validate(table, mutation.values)
+    if error:
+        return {**result, "status": "rejected", "error": error}
+    for field, value in mutation.values.items():
+        setattr(instance, field, value)
+    db.flush()
+    db.refresh(instance)
+    return {**result, "status": "applied", "updated_at": instance.updated_at}
+
+
+def apply_mutations(
+    db: Session,
+    batch: SyncMutationBatch,
+    on_applied: Optional[Callable[[SyncTable, SyncMutationIn, Dict[str, Any]], None]] = None
+) -> List[Dict[str, Any]]:
+    """Applies each mutation in its own savepoint; commits once at the end."""
+    keys = [mutation.idempotency_key for mutation in batch.mutations]
+    seen = {
+        record.idempotency_key: record
+        for record in db.query(SyncMutationRecord).filter(SyncMutationRecord.idempotency_key.in_(keys))
+    }
+    results = []
+    applied = []
+
+    for mutation in batch.mutations:
+        record = seen.get(mutation.idempotency_key)
+        if record is not None and record.status != "pending":
+            results.append({**record.result, "replayed": True})
+            continue
+        table = SYNC_TABLES.get(mutation.table)
+        if table is None:
+            results.append({"idempotency_key": mutation.idempotency_key, "status": "rejected",
+                            "error": f"unknown table {mutation.table}"})
+            continue
+
+        try:
+            with db.begin_nested():
+                # Claim the key first: a concurrent request with the same key waits here
+                claimed = db.execute(text("""
+                INSERT INTO work_orders.sync_mutations (idempotency_key, device_id, status)
+                VALUES (:key, :device, 'pending')
+                ON CONFLICT (idempotency_key) DO NOTHING
+                RETURNING 1
+                """), {"key": mutation.idempotency_key, "device": batch.device_id}).scalar()
+                if not claimed:
+                    raise _AlreadyClaimed()
+                result = SyncMutationResult(**_apply(db, table, mutation)).model_dump(mode="json")
+                db.execute(text("""
+                UPDATE work_orders.sync_mutations SET status = :status, result = CAST(:result AS JSONB)
+                WHERE idempotency_key = :key
+                """), {"status": result["status"], "result": json.dumps(result), "key": mutation.idempotency_key})
+        except SQLAlchemyError as exc:
+            # Not stored: the savepoint rolled back the claim as well
+            results.append({"idempotency_key": mutation.idempotency_key, "status": "rejected",
+                            "error": str(getattr(exc, "orig", None) or exc).splitlines()[0]})
+            continue
+        except _AlreadyClaimed:
+            stored = db.get(SyncMutationRecord, mutation.idempotency_key, populate_existing=True)
+            result = {**stored.result, "replayed": True} if stored is not None and stored.result else {
+                "idempotency_key": mutation.idempotency_key, "status": "rejected",
+                "error": "mutation is being applied by another request"}
+            results.append(result)
+            continue
+
+        results.append(result)
+        if result["status"] == "applied":
+            applied.append((table, mutation, result))
+
+    db.commit()
+    if on_applied is not None:
+        for table, mutation, result in applied:
+            on_applied(table, mutation, result)
+    return results
+
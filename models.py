@@ -4,12 +4,12 @@ These models map to the PostgreSQL database schemas created in database initiali
 """
 from sqlalchemy import (
     Boolean, Column, Integer, String, DateTime, Text, Enum as SQLEnum,
-    ForeignKey, DECIMAL, ARRAY, TIMESTAMP, BigInteger
+    ForeignKey, DECIMAL, ARRAY, TIMESTAMP, BigInteger, Index, MetaData
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.dialects.postgresql import UUID, JSONB, INET, ENUM
-from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func, text
+from sqlalchemy.orm import declared_attr, relationship
 import enum
 import uuid as uuid_pkg
 
@@ -59,7 +59,32 @@ class ServiceStatus(str, enum.Enum):
     DISCONTINUED = "Discontinued"
 
 
-class User(Base):
+class Branch(Base):
+    """Workshop branch; the same directory is kept on every shard (16-branches.sql)"""
+    __tablename__ = "branches"
+    __table_args__ = {'schema': 'user_management'}
+
+    id = Column(Integer, primary_key=True)
+    code = Column(String(20), unique=True, nullable=False)
+    name = Column(String(255), nullable=False)
+    name_ar = Column(String(255), nullable=True)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+
+class BranchScoped:
+    """Rows owned by one branch; sessions from database.get_db only see their branch's rows"""
+
+    @declared_attr
+    def branch_id(cls):
+        # The database fills it from the session's yaman.branch_id setting
+        return Column(
+            Integer, ForeignKey('user_management.branches.id'), nullable=False,
+            server_default=text('COALESCE(current_branch_id(), 1)')
+        )
+
+
+class User(BranchScoped, Base):
     __tablename__ = "users"
     __table_args__ = {'schema': 'user_management'}
 
@@ -173,7 +198,7 @@ class ServiceSpecification(Base):
     sort_order = Column(Integer, default=0)
 
 
-class WorkOrder(Base):
+class WorkOrder(BranchScoped, Base):
     __tablename__ = "work_orders"
     __table_args__ = {'schema': 'work_orders'}
 
@@ -228,6 +253,11 @@ class WorkOrder(Base):
     closure_reason = Column(Text, nullable=True)
 
 
+# Closed work orders moved out by shared.archiver (15-archive-tiering.sql); read-only,
+# and kept off Base.metadata so create_all() never creates it
+archived_work_orders = WorkOrder.__table__.to_metadata(MetaData(), schema="archive")
+
+
 class WorkOrderService(Base):
     __tablename__ = "work_order_services"
     __table_args__ = {'schema': 'work_orders'}
@@ -327,7 +357,8 @@ class WorkOrderImage(Base):
     uploaded_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
 
 
-class ChatRoom(Base):
+
+class ChatRoom(BranchScoped, Base):
     __tablename__ = "chat_rooms"
     __table_args__ = {'schema': 'chat_system'}
 
@@ -407,6 +438,7 @@ class MessageAttachment(Base):
     uploaded_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
 
 
+
 class MessageReaction(Base):
     __tablename__ = "message_reactions"
     __table_args__ = {'schema': 'chat_system'}
@@ -450,7 +482,10 @@ class DeletedMessage(Base):
     deletion_reason = Column(Text, nullable=True)
 
 
-class Inspection(Base):
+INSPECTION_STATUSES = ("Draft", "Pending", "In_Progress", "Completed", "Approved", "Rejected")
+
+
+class Inspection(BranchScoped, Base):
     __tablename__ = "inspections"
     __table_args__ = {'schema': 'work_orders'}
 
@@ -514,6 +549,7 @@ class InspectionFault(Base):
     
     created_by = Column(Integer, ForeignKey('user_management.users.id'), nullable=False)
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
 
 
 class InspectionPhoto(Base):
@@ -536,19 +572,49 @@ class InspectionPhoto(Base):
     
     uploaded_by = Column(Integer, ForeignKey('user_management.users.id'), nullable=False)
     uploaded_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class SyncTombstone(Base):
+    """Deleted rows of the synced tables, written by a trigger (17-offline-sync.sql)"""
+    __tablename__ = "sync_tombstones"
+    __table_args__ = {'schema': 'work_orders'}
+
+    id = Column(BigInteger, primary_key=True)
+    table_name = Column(String(50), nullable=False)
+    record_id = Column(Integer, nullable=False)
+    branch_id = Column(Integer, nullable=True)
+    deleted_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+
+class SyncMutation(Base):
+    """Offline edits already applied, by idempotency key"""
+    __tablename__ = "sync_mutations"
+    __table_args__ = {'schema': 'work_orders'}
+
+    idempotency_key = Column(String(100), primary_key=True)
+    device_id = Column(String(100), nullable=False)
+    status = Column(String(20), nullable=False)
+    result = Column(JSONB, nullable=True)
+    applied_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
 
 
 class AuditTrail(Base):
+    """Range-partitioned by month on timestamp (14-audit-partitioning.sql); written via shared.audit"""
     __tablename__ = "audit_trail"
-    __table_args__ = {'schema': 'audit_logs'}
-
-    id = Column(Integer, primary_key=True, index=True)
-    table_name = Column(String(100), nullable=False, index=True)
-    operation = Column(String(20), nullable=False, index=True)
+    __table_args__ = (
+        Index('idx_audit_trail_record', 'table_name', 'record_id', 'timestamp'),
+        Index('idx_audit_trail_user', 'user_id', 'timestamp'),
+        {'schema': 'audit_logs', 'postgresql_partition_by': 'RANGE (timestamp)'},
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    table_name = Column(String(100), nullable=False)
+    operation = Column(String(20), nullable=False)
     record_id = Column(Integer, nullable=True)
     old_values = Column(JSONB, nullable=True)
     new_values = Column(JSONB, nullable=True)
-    user_id = Column(Integer, nullable=True, index=True)
-    timestamp = Column(TIMESTAMP(timezone=True), server_default=func.now(), index=True)
+    user_id = Column(Integer, nullable=True)
+    timestamp = Column(TIMESTAMP(timezone=True), server_default=func.now(), primary_key=True)
     ip_address = Column(INET, nullable=True)
     user_agent = Column(Text, nullable=True)
@@ -0,0 +1,153 @@
+"""
+Fast response serialization for trusted database rows - تسلسل سريع للاستجابات
+
+FastAPI validates every returned object against `response_model` and then
+walks the result again with jsonable_encoder before json.dumps. For rows we
+just read from our own database that work is redundant, so list endpoints can
+instead return:
+
+    return trusted_response(WorkOrderResponse, work_orders)
+
+which reads the response model's fields straight off the ORM objects (or
+SQLAlchemy rows) with a getter compiled once per model, converts only the
+fields that need it (Decimal -> float) and encodes with orjson.
+Keep `response_model=` on the route so the OpenAPI schema is unchanged.
+
+`columns_for` selects only the response fields, which also skips building ORM
+instances:
+
+    rows = db.query(*columns_for(WorkOrderResponse, WorkOrderModel)).all()
+
+orjson is optional; without it the stdlib encoder is used with the same output.
+"""
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Optional, Type, Union, get_args, get_origin
+import json
+import uuid
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def _json_default(value: Any):
+    if isinstance(value, datetime):
+        # Same format as pydantic: UTC as "Z"
+        text = value.isoformat()
+        return text[:-6] + "Z" if text.endswith("+00:00") else text
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"),
+                      default=_json_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# Row serializers --------------------------------------------------------------
+
+def _unwrap_optional(annotation):
+    if get_origin(annotation) is Union:
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def _to_float(value):
+    return None if value is None else float(value)
+
+
+def _converter(annotation) -> Optional[Callable[[Any], Any]]:
+    annotation = _unwrap_optional(annotation)
+    # Numeric columns come back as Decimal; the response declares float
+    if annotation is float:
+        return _to_float
+    return None
+
+
+class RowSerializer:
+    """Builds response dicts for one response model without pydantic validation."""
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self.fields = tuple(model.model_fields)
+        self._get = attrgetter(*self.fields)
+        self._converters = tuple(
+            (index, converter)
+            for index, field in enumerate(model.model_fields.values())
+            if (converter := _converter(field.annotation)) is not None
+        )
+
+    def _values(self, rows: List[Any]):
+        if getattr(rows[0], "_fields", None) == self.fields:
+            # Rows from db.query(*columns_for(...)) are already in field order
+            return rows
+        if len(self.fields) == 1:
+            return [(self._get(row),) for row in rows]
+        return map(self._get, rows)
+
+    def many(self, rows: List[Any]) -> List[Dict[str, Any]]:
+        if not rows:
+            return []
+        fields = self.fields
+        if not self._converters:
+            return [dict(zip(fields, values)) for values in self._values(rows)]
+        result = []
+        for values in self._values(rows):
+            values = list(values)
+            for index, converter in self._converters:
+                values[index] = converter(values[index])
+            result.append(dict(zip(fields, values)))
+        return result
+
+    def __call__(self, row: Any) -> Dict[str, Any]:
+        return self.many([row])[0]
+
+
+_serializers: Dict[Type[BaseModel], RowSerializer] = {}
+
+
+def serializer_for(model: Type[BaseModel]) -> RowSerializer:
+    serializer = _serializers.get(model)
+    if serializer is None:
+        serializer = _serializers[model] = RowSerializer(model)
+    return serializer
+
+
+def columns_for(model: Type[BaseModel], orm_model) -> list:
+    """ORM column attributes for the response model's fields, for db.query(*columns)."""
+    return [getattr(orm_model, name) for name in model.model_fields]
+
+
+def trusted_response(model: Type[BaseModel], rows: Any, status_code: int = 200) -> FastJSONResponse:
+    """Serialize rows read from our own database, skipping response_model validation."""
+    serializer = serializer_for(model)
+    if isinstance(rows, list):
+        content = serializer.many(rows)
+    else:
+        content = serializer(rows)
+    return FastJSONResponse(content, status_code=status_code)
@@ -0,0 +1,154 @@
+"""
+Branch scoping and shard map - الفروع وتوزيعها على قواعد البيانات
+
+Each request works on one branch (workshop): the branch_id claim of its
+bearer token, which login sets from the user's row. An X-Branch-Id header
+must name that same branch. Requests without a token (or with a token that
+carries no branch) only reach DEFAULT_BRANCH_ID. A branch's rows live on one
+shard: BRANCH_SHARDS maps branch ids to shard names ("2=east,3=east") and
+DATABASE_SHARDS maps shard names to URLs ("east=postgresql://..."). Branches
+not listed stay on the "default" shard, DATABASE_URL, which also holds the
+global data (document number counters, audit trail, service catalog).
+
+Connections are scoped by setting yaman.branch_id, which the row security
+policies and the branch_id column defaults read (16-branches.sql). Ids are
+per shard, so rows gathered from several shards are keyed by (branch_id, id).
+
+    pools = ShardPools()
+    await pools.open(DATABASE_URL, min_size=2, max_size=20)
+    async with pools.acquire(branch_id) as conn:      # scoped to the branch
+        ...
+    rows = await pools.gather(lambda conn: conn.fetch(REPORT_SQL))   # all shards
+"""
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import os
+
+DEFAULT_SHARD = "default"
+DEFAULT_BRANCH_ID = int(os.getenv("DEFAULT_BRANCH_ID", "1"))
+BRANCH_HEADER = "X-Branch-Id"
+# Same secret and algorithm app.py signs its access tokens with
+TOKEN_SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
+TOKEN_ALGORITHM = "HS256"
+TOKEN_BRANCH_CLAIM = "branch_id"
+
+# asyncpg takes $n placeholders; SQLAlchemy text() uses the :name variant in database.py
+SET_BRANCH_SQL = "SELECT set_config('yaman.branch_id', $1, false)"
+
+
+def _pairs(value: str) -> List[Tuple[str, str]]:
+    pairs = []
+    for item in value.split(","):
+        if item.strip():
+            key, sep, val = item.partition("=")
+            if not sep or not key.strip() or not val.strip():
+                raise ValueError(f"expected name=value, got {item!r}")
+            pairs.append((key.strip(), val.strip()))
+    return pairs
+
+
+BRANCH_SHARDS: Dict[int, str] = {int(branch): shard for branch, shard in _pairs(os.getenv("BRANCH_SHARDS", ""))}
+DATABASE_SHARDS: Dict[str, str] = dict(_pairs(os.getenv("DATABASE_SHARDS", "")))
+
+_unknown = set(BRANCH_SHARDS.values()) - set(DATABASE_SHARDS) - {DEFAULT_SHARD}
+if _unknown:
+    raise ValueError(f"BRANCH_SHARDS names shards missing from DATABASE_SHARDS: {', '.join(sorted(_unknown))}")
+
+
+def shard_for(branch_id: int) -> str:
+    return BRANCH_SHARDS.get(branch_id, DEFAULT_SHARD)
+
+
+def shard_urls(default_url: str) -> Dict[str, str]:
+    """Shard name -> URL, the default shard first."""
+    return {DEFAULT_SHARD: default_url, **{name: url for name, url in DATABASE_SHARDS.items() if name != DEFAULT_SHARD}}
+
+
+def parse_branch_id(value: Optional[str]) -> int:
+    """Branch id from a header value; ValueError if it is not a positive integer."""
+    if value is None or not value.strip():
+        return DEFAULT_BRANCH_ID
+    branch_id = int(value)
+    if branch_id < 1:
+        raise ValueError(f"invalid branch id: {value}")
+    return branch_id
+
+
+class InvalidToken(Exception):
+    """The Authorization header holds a bearer token that does not verify."""
+
+
+def token_branch_id(authorization: Optional[str], secret_key: str = TOKEN_SECRET_KEY,
+                    algorithm: str = TOKEN_ALGORITHM) -> Optional[int]:
+    """Branch claim of a bearer token; None without a token or claim, InvalidToken if it does not verify."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    from jose import JWTError, jwt
+
+    try:
+        claims = jwt.decode(token.strip(), secret_key, algorithms=[algorithm])
+    except JWTError as e:
+        raise InvalidToken(str(e))
+    branch = claims.get(TOKEN_BRANCH_CLAIM)
+    if branch is None:
+        return None
+    if not isinstance(branch, int) or isinstance(branch, bool) or branch < 1:
+        raise InvalidToken(f"invalid {TOKEN_BRANCH_CLAIM} claim")
+    return branch
+
+
+def resolve_branch_id(header: Optional[str], token_branch: Optional[int]) -> int:
+    """
+    The request's branch: the token's, or DEFAULT_BRANCH_ID without one.
+    ValueError for a malformed header, PermissionError for a header naming another branch.
+    """
+    allowed = token_branch if token_branch is not None else DEFAULT_BRANCH_ID
+    if header is None or not header.strip():
+        return allowed
+    requested = parse_branch_id(header)
+    if requested != allowed:
+        raise PermissionError(f"{BRANCH_HEADER} {requested} does not match the authenticated branch")
+    return requested
+
+
+class ShardPools:
+    """One asyncpg pool per shard for the async services."""
+
+    def __init__(self):
+        self.pools: Dict[str, object] = {}
+
+    async def open(self, default_url: str, **pool_kwargs):
+        import asyncpg
+
+        for name, url in shard_urls(default_url).items():
+            self.pools[name] = await asyncpg.create_pool(url, **pool_kwargs)
+
+    @property
+    def default(self):
+        return self.pools[DEFAULT_SHARD]
+
+    def pool_for(self, branch_id: int):
+        return self.pools[shard_for(branch_id)]
+
+    @asynccontextmanager
+    async def acquire(self, branch_id: int):
+        async with self.pool_for(branch_id).acquire() as conn:
+            # Session-level: the pool's RESET ALL clears it when the connection is released
+            await conn.execute(SET_BRANCH_SQL, str(branch_id))
+            yield conn
+
+    async def gather(self, query: Callable[[object], Awaitable]) -> Dict[str, object]:
+        """Runs query(conn) on every shard concurrently, unscoped; results by shard name."""
+        async def run(pool):
+            async with pool.acquire() as conn:
+                return await query(conn)
+
+        names = list(self.pools)
+        results = await asyncio.gather(*(run(self.pools[name]) for name in names))
+        return dict(zip(names, results))
+
+    async def close(self):
+        await asyncio.gather(*(pool.close() for pool in self.pools.values()))
+        self.pools.clear()
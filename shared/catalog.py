@@ -0,0 +1,377 @@
+"""
+Service catalog cache - ذاكرة دليل الخدمات وأسعارها المتدرجة
+
+Categories, services, their active pricing tiers and their specifications are
+loaded into one immutable CatalogSnapshot (tuples, named tuples and read-only
+mappings), so reads are dict hits and never touch the database:
+
+    snapshot = catalog.snapshot
+    service = snapshot.find("Engine Oil Change")       # name, Arabic name or code
+    unit_price, tier = service.unit_price(quantity=12)  # O(log tiers)
+
+A statement trigger on each catalog table sends NOTIFY catalog_changed
+(20-catalog-cache.sql). The cache waits CATALOG_RELOAD_DEBOUNCE seconds for a
+burst of changes (a bulk import) to settle, reloads everything in one
+read-only transaction and swaps the new snapshot in with one assignment, so
+readers never see a half-updated catalog. It also reloads every
+CATALOG_RELOAD_SECONDS in case a notification was missed while the listening
+connection was down.
+
+    catalog.bind(pool)                         # asyncpg services, at startup
+    await catalog.reload()
+    catalog.start(DATABASE_URL)                # listen and reload in a task
+    await catalog.stop()
+
+    catalog = SyncCatalogCache(engine)        # SQLAlchemy (app.py): background thread
+    catalog.start()
+
+Until the first load succeeds `ready` is False and callers read the tables.
+catalog.subscribe(callback) runs callback(snapshot) after every swap (from the
+reload task or thread) for indexes derived from the snapshot.
+"""
+from bisect import bisect_right
+from datetime import datetime, timezone
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+import asyncio
+import hashlib
+import logging
+import os
+import select
+import threading
+import time
+
+from .instrumentation.metrics import registry
+
+CATALOG_CHANNEL = "catalog_changed"
+CATALOG_RELOAD_SECONDS = float(os.getenv("CATALOG_RELOAD_SECONDS", "300"))
+CATALOG_RELOAD_DEBOUNCE = float(os.getenv("CATALOG_RELOAD_DEBOUNCE", "0.5"))
+
+CATEGORIES_SQL = """
+SELECT id, name, name_ar, COALESCE(sort_order, 0), is_active IS NOT FALSE
+FROM service_catalog.service_categories ORDER BY 4, id
+"""
+SERVICES_SQL = """
+SELECT id, service_code, category_id, name, name_ar, COALESCE(base_price, 0), COALESCE(currency, 'YER'),
+       estimated_duration, status::TEXT, COALESCE(is_featured, FALSE), tags, updated_at
+FROM service_catalog.services ORDER BY id
+"""
+TIERS_SQL = """
+SELECT service_id, tier_name, tier_name_ar, COALESCE(min_quantity, 1) AS min_quantity, max_quantity, price, currency
+FROM service_catalog.service_pricing WHERE is_active IS NOT FALSE ORDER BY service_id, 4, id
+"""
+SPECS_SQL = """
+SELECT service_id, spec_name, spec_name_ar, spec_value, spec_value_ar, spec_type, COALESCE(is_required, FALSE)
+FROM service_catalog.service_specifications ORDER BY service_id, sort_order, id
+"""
+
+logger = logging.getLogger("yaman.catalog")
+
+reloads = registry.counter("catalog_reloads_total", "Service catalog reloads by outcome", ("service", "outcome"))
+services_loaded = registry.gauge("catalog_services", "Services in the cached catalog", ("service",))
+reload_duration = registry.histogram("catalog_reload_duration_seconds", "Time to load the catalog", ("service",))
+
+
+class Tier(NamedTuple):
+    name: str
+    name_ar: str
+    min_quantity: int
+    max_quantity: Optional[int]  # None: no upper bound
+    price: Decimal
+    currency: str
+
+
+class Spec(NamedTuple):
+    name: str
+    name_ar: str
+    value: str
+    value_ar: Optional[str]
+    type: str
+    is_required: bool
+
+
+class CatalogService(NamedTuple):
+    id: int
+    service_code: str
+    category_id: int
+    name: str
+    name_ar: str
+    base_price: Decimal
+    currency: str
+    estimated_duration: Optional[int]
+    status: str
+    is_featured: bool
+    tags: Tuple[str, ...]
+    updated_at: Optional[datetime]
+    tiers: Tuple[Tier, ...] = ()
+    tier_starts: Tuple[int, ...] = ()  # min_quantity of each tier, for bisect
+    specs: Tuple[Spec, ...] = ()
+
+    def tier_for(self, quantity: int) -> Optional[Tier]:
+        """The tier whose range holds quantity; the highest starting one if ranges overlap."""
+        index = bisect_right(self.tier_starts, quantity) - 1
+        if index < 0:
+            return None
+        tier = self.tiers[index]
+        if tier.max_quantity is not None and quantity > tier.max_quantity:
+            return None
+        return tier
+
+    def unit_price(self, quantity: int = 1) -> Tuple[Decimal, Optional[Tier]]:
+        tier = self.tier_for(quantity)
+        return (tier.price, tier) if tier is not None else (self.base_price, None)
+
+
+class Category(NamedTuple):
+    id: int
+    name: str
+    name_ar: str
+    sort_order: int
+    is_active: bool
+    services: Tuple[CatalogService, ...]
+
+
+def _key(value: str) -> str:
+    return " ".join(value.split()).lower()
+
+
+class CatalogSnapshot:
+    """One consistent, read-only view of the catalog."""
+
+    __slots__ = ("categories", "services", "_by_id", "_by_name", "version", "loaded_at")
+
+    def __init__(self, categories: Sequence[Category], services: Sequence[CatalogService], version: str = "",
+                 loaded_at: Optional[datetime] = None):
+        self.categories: Tuple[Category, ...] = tuple(categories)
+        self.services: Tuple[CatalogService, ...] = tuple(services)
+        self._by_id: Mapping[int, CatalogService] = MappingProxyType({s.id: s for s in self.services})
+        names: Dict[str, CatalogService] = {}
+        for service in self.services:
+            # Codes win over names, English over Arabic, when two services collide
+            for value in (service.name_ar, service.name, service.service_code):
+                if value:
+                    names[_key(value)] = service
+        self._by_name: Mapping[str, CatalogService] = MappingProxyType(names)
+        self.version = version
+        self.loaded_at = loaded_at
+
+    def __len__(self) -> int:
+        return len(self.services)
+
+    def service(self, service_id: int) -> Optional[CatalogService]:
+        return self._by_id.get(service_id)
+
+    def find(self, name_or_code: Optional[str]) -> Optional[CatalogService]:
+        return self._by_name.get(_key(name_or_code)) if name_or_code else None
+
+    def available(self) -> List[CatalogService]:
+        return [service for service in self.services if service.status == "Available"]
+
+    @classmethod
+    def build(cls, categories: Sequence[tuple], services: Sequence[tuple], tiers: Sequence[tuple],
+              specs: Sequence[tuple]) -> "CatalogSnapshot":
+        """From rows in the column order of the *_SQL queries; version is a digest of all of them."""
+        digest = hashlib.blake2b(digest_size=12)
+        for rows in (categories, services, tiers, specs):
+            digest.update(repr(rows).encode("utf-8"))
+        tiers_by_service: Dict[int, List[Tier]] = {}
+        for service_id, *values in tiers:
+            tiers_by_service.setdefault(service_id, []).append(Tier(*values))
+        specs_by_service: Dict[int, List[Spec]] = {}
+        for service_id, *values in specs:
+            specs_by_service.setdefault(service_id, []).append(Spec(*values))
+
+        built = []
+        for row in services:
+            service_tiers = tuple(tiers_by_service.get(row[0], ()))
+            built.append(CatalogService(
+                *row[:10], tuple(row[10] or ()), row[11],
+                service_tiers, tuple(tier.min_quantity for tier in service_tiers),
+                tuple(specs_by_service.get(row[0], ())),
+            ))
+        by_category: Dict[int, List[CatalogService]] = {}
+        for service in built:
+            by_category.setdefault(service.category_id, []).append(service)
+        return cls(
+            [Category(*row, services=tuple(by_category.get(row[0], ()))) for row in categories],
+            built, digest.hexdigest(), datetime.now(timezone.utc),
+        )
+
+
+class _BaseCatalogCache:
+    def __init__(self, service: str):
+        self.service = service
+        self.snapshot = CatalogSnapshot((), ())
+        self.ready = False
+        self._subscribers: List[Callable[[CatalogSnapshot], None]] = []
+
+    def subscribe(self, callback: Callable[[CatalogSnapshot], None]):
+        """Call callback(snapshot) after each new snapshot is swapped in, to rebuild derived indexes."""
+        self._subscribers.append(callback)
+
+    def _replace(self, rows: Tuple[Sequence[tuple], ...], started: float):
+        snapshot = CatalogSnapshot.build(*rows)
+        self.snapshot = snapshot
+        self.ready = True
+        for callback in self._subscribers:
+            try:
+                callback(snapshot)
+            except Exception:
+                logger.exception("catalog subscriber failed")
+        reload_duration.observe(time.perf_counter() - started, self.service)
+        services_loaded.set(len(snapshot), self.service)
+        reloads.inc(self.service, "ok")
+
+
+class CatalogCache(_BaseCatalogCache):
+    """asyncpg cache; listens on its own connection, reloads through the pool."""
+
+    def __init__(self, service: str = "work_order_management"):
+        super().__init__(service)
+        self.pool = None
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def bind(self, pool):
+        self.pool = pool
+
+    def start(self, dsn: str):
+        self._task = asyncio.create_task(self._run(dsn))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def reload(self):
+        started = time.perf_counter()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                rows = []
+                for sql in (CATEGORIES_SQL, SERVICES_SQL, TIERS_SQL, SPECS_SQL):
+                    rows.append([tuple(row) for row in await conn.fetch(sql)])
+        self._replace(tuple(rows), started)
+
+    def _on_notify(self, *args):
+        self._changed.set()
+
+    async def _run(self, dsn: str):
+        import asyncpg
+
+        listener = None
+        while True:
+            try:
+                if listener is None or listener.is_closed():
+                    listener = await asyncpg.connect(dsn)
+                    await listener.add_listener(CATALOG_CHANNEL, self._on_notify)
+                    self._changed.set()  # changes may have been missed while not listening
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=CATALOG_RELOAD_SECONDS)
+                    await asyncio.sleep(CATALOG_RELOAD_DEBOUNCE)
+                except asyncio.TimeoutError:
+                    pass
+                self._changed.clear()
+                await self.reload()
+            except asyncio.CancelledError:
+                if listener is not None:
+                    await listener.close()
+                raise
+            except Exception as e:
+                reloads.inc(self.service, "error")
+                logger.warning("catalog reload failed, retrying: %s", e)
+                if listener is not None and not listener.is_closed():
+                    await listener.close()
+                listener = None
+                await asyncio.sleep(min(CATALOG_RELOAD_SECONDS, 5))
+
+
+class SyncCatalogCache(_BaseCatalogCache):
+    """SQLAlchemy/psycopg2 cache for synchronous apps; listens from a daemon thread."""
+
+    def __init__(self, engine, service: str = "app"):
+        super().__init__(service)
+        self.engine = engine
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        try:
+            self.reload()
+        except Exception as e:
+            reloads.inc(self.service, "error")
+            logger.warning("catalog load failed, reading the tables until it succeeds: %s", e)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="catalog-cache", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def reload(self):
+        started = time.perf_counter()
+        raw = self.engine.raw_connection()
+        try:
+            with raw.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+                rows = []
+                for sql in (CATEGORIES_SQL, SERVICES_SQL, TIERS_SQL, SPECS_SQL):
+                    cursor.execute(sql)
+                    rows.append(cursor.fetchall())
+            raw.rollback()
+        finally:
+            raw.close()
+        self._replace(tuple(rows), started)
+
+    def _listen(self):
+        import psycopg2
+
+        # A connection of its own: LISTEN needs autocommit and would pin a pool slot
+        conn = psycopg2.connect(self.engine.url.set(drivername="postgresql").render_as_string(hide_password=False))
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {CATALOG_CHANNEL}")
+        return conn
+
+    def _run(self):
+        conn = None
+        while not self._stopping.is_set():
+            try:
+                if conn is None:
+                    conn = self._listen()
+                    changed = True  # changes may have been missed while not listening
+                else:
+                    # Short waits so stop() is noticed; reload on notify or every CATALOG_RELOAD_SECONDS
+                    changed = False
+                    deadline = time.monotonic() + CATALOG_RELOAD_SECONDS
+                    while not changed and time.monotonic() < deadline and not self._stopping.is_set():
+                        if select.select([conn], [], [], 1.0)[0]:
+                            conn.poll()
+                            changed = bool(conn.notifies)
+                            conn.notifies.clear()
+                    if self._stopping.is_set():
+                        break
+                    time.sleep(CATALOG_RELOAD_DEBOUNCE)
+                    conn.poll()
+                    conn.notifies.clear()
+                self.reload()
+            except Exception as e:
+                reloads.inc(self.service, "error")
+                logger.warning("catalog reload failed, retrying: %s", e)
+                if conn is not None:
+                    conn.close()
+                conn = None
+                self._stopping.wait(min(CATALOG_RELOAD_SECONDS, 5))
+        if conn is not None:
+            conn.close()
+
+
+# Shared per-process instance for the asyncpg services
+catalog = CatalogCache()
@@ -0,0 +1,387 @@
+"""
+Idempotency keys for write requests - منع تكرار الطلبات عند إعادة الإرسال
+
+A client that may retry a POST/PUT/PATCH/DELETE (the mobile app on a flaky
+network) sends an Idempotency-Key header. The first request with a key runs
+normally and its response is stored; any later request with the same key gets
+that response back (with Idempotent-Replayed: true) instead of running again.
+
+- A key is scoped to the service, the Authorization header and the branch, so
+  two callers never share a response.
+- The request is fingerprinted (method, path, query, body). Reusing a key for a
+  different request is a client bug and gets 422. Multipart boundaries are
+  ignored, since a retried upload is usually re-encoded with a new one.
+- A duplicate that arrives while the first request is still running waits for
+  it (up to IDEMPOTENCY_WAIT_SECONDS, then 409 with Retry-After).
+- 5xx responses and requests that fail with an exception are not stored; the
+  key is released so the retry runs again.
+- Stored responses expire after IDEMPOTENCY_TTL_SECONDS. Responses larger than
+  IDEMPOTENCY_MAX_RESPONSE_BYTES are not stored.
+
+Responses live in work_orders.idempotency_keys (18-idempotency-keys.sql), so
+every worker sees them; each worker keeps recent ones in an in-memory LRU in
+front of it. Requests without the header are passed through untouched. If
+the table cannot be reached the request runs without protection (logged and
+counted as "unavailable"), as with the audit writer.
+
+    app.add_middleware(IdempotencyMiddleware, store=SyncIdempotencyStore(engine), service="app")
+
+    app.add_middleware(IdempotencyMiddleware, store=idempotency_store, service="work_order_management")
+    idempotency_store.bind(pool)              # asyncpg services, at startup
+"""
+from collections import OrderedDict
+from typing import Callable, List, NamedTuple, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+from .branches import BRANCH_HEADER
+from .instrumentation.metrics import registry
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# How long a claimed key is held before another worker may assume the first one died
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+IDEMPOTENCY_MAX_RESPONSE_BYTES = int(os.getenv("IDEMPOTENCY_MAX_RESPONSE_BYTES", str(1024 * 1024)))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "1024"))
+
+WRITE_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+MAX_KEY_LENGTH = 255
+
+# Not replayed: per-response values the outer middleware or server set again
+_SKIPPED_HEADERS = {b"date", b"server", b"set-cookie"}
+
+CLAIM_SQL = "SELECT claim_idempotency_key($1, $2, $3)"
+FETCH_SQL = """
+SELECT fingerprint, status_code, headers, body, expires_at
+FROM work_orders.idempotency_keys WHERE key_hash = $1
+"""
+COMPLETE_SQL = """
+UPDATE work_orders.idempotency_keys
+SET status_code = $1, headers = $2, body = $3, locked_until = NULL,
+    expires_at = now() + make_interval(secs => $4)
+WHERE key_hash = $5
+"""
+RELEASE_SQL = "DELETE FROM work_orders.idempotency_keys WHERE key_hash = $1 AND status_code IS NULL"
+
+logger = logging.getLogger("yaman.idempotency")
+
+requests_total = registry.counter(
+    "idempotency_requests_total", "Requests carrying an Idempotency-Key, by outcome", ("service", "outcome")
+)
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: bytes
+    status_code: Optional[int]  # None: the first request is still running
+    headers: List[List[str]]
+    body: bytes
+    expires_at: float
+
+
+def key_hash(service: str, caller: str, branch: str, key: str) -> bytes:
+    return hashlib.sha256("\0".join((service, caller, branch, key)).encode()).digest()
+
+
+def request_fingerprint(method: str, path: str, query: bytes, content_type: str, body: bytes) -> bytes:
+    match = re.search(r'boundary="?([^";]+)"?', content_type) if content_type.startswith("multipart/") else None
+    if match:
+        body = body.replace(match.group(1).encode("latin-1"), b"")
+    digest = hashlib.sha256(f"{method} {path}?".encode())
+    digest.update(query)
+    digest.update(b"\0")
+    digest.update(body)
+    return digest.digest()
+
+
+def _stored(row) -> StoredResponse:
+    headers = row[2]
+    if isinstance(headers, str):  # asyncpg returns jsonb as text
+        headers = json.loads(headers)
+    return StoredResponse(bytes(row[0]), row[1], headers or [], bytes(row[3] or b""), row[4].timestamp())
+
+
+class _BaseIdempotencyStore:
+    @property
+    def ready(self) -> bool:
+        return True
+
+    async def claim(self, key: bytes, fingerprint: bytes, lock_seconds: int) -> bool:
+        return bool(await self._fetchval(CLAIM_SQL, key, fingerprint, lock_seconds))
+
+    async def fetch(self, key: bytes) -> Optional[StoredResponse]:
+        row = await self._fetchrow(FETCH_SQL, key)
+        return _stored(row) if row is not None else None
+
+    async def complete(self, key: bytes, response: StoredResponse, ttl_seconds: int):
+        await self._execute(COMPLETE_SQL, response.status_code, json.dumps(response.headers), response.body,
+                            float(ttl_seconds), key)
+
+    async def release(self, key: bytes):
+        await self._execute(RELEASE_SQL, key)
+
+
+class IdempotencyStore(_BaseIdempotencyStore):
+    """asyncpg store; one per process, bound to the service's pool at startup."""
+
+    def __init__(self):
+        self.pool = None
+
+    def bind(self, pool):
+        self.pool = pool
+
+    @property
+    def ready(self) -> bool:
+        return self.pool is not None
+
+    async def _fetchval(self, sql: str, *args):
+        return await self.pool.fetchval(sql, *args)
+
+    async def _fetchrow(self, sql: str, *args):
+        return await self.pool.fetchrow(sql, *args)
+
+    async def _execute(self, sql: str, *args):
+        await self.pool.execute(sql, *args)
+
+
+class SyncIdempotencyStore(_BaseIdempotencyStore):
+    """SQLAlchemy/psycopg2 store for the synchronous app; queries run in a worker thread."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def _run(self, sql: str, args, fetch: Callable):
+        # The statements number their parameters in order, so $n maps onto %s
+        raw = self.engine.raw_connection()
+        try:
+            with raw.cursor() as cursor:
+                cursor.execute(re.sub(r"\$\d+", "%s", sql), args)
+                result = fetch(cursor)
+            raw.commit()
+            return result
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+    async def _fetchval(self, sql: str, *args):
+        row = await asyncio.to_thread(self._run, sql, args, lambda cursor: cursor.fetchone())
+        return row[0] if row is not None else None
+
+    async def _fetchrow(self, sql: str, *args):
+        return await asyncio.to_thread(self._run, sql, args, lambda cursor: cursor.fetchone())
+
+    async def _execute(self, sql: str, *args):
+        await asyncio.to_thread(self._run, sql, args, lambda cursor: None)
+
+
+class ResponseCache:
+    """Per-process LRU of completed responses; entries never change until they expire."""
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, StoredResponse]" = OrderedDict()
+
+    def get(self, key: bytes) -> Optional[StoredResponse]:
+        response = self._entries.get(key)
+        if response is None:
+            return None
+        if response.expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def put(self, key: bytes, response: StoredResponse):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = response
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class _StoreUnavailable(Exception):
+    pass
+
+
+async def _send_error(send, status: int, detail: str, headers=()):
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *headers,
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app, store: _BaseIdempotencyStore, service: str, methods=WRITE_METHODS,
+                 cache: Optional[ResponseCache] = None, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS,
+                 lock_seconds: int = IDEMPOTENCY_LOCK_SECONDS, wait_seconds: float = IDEMPOTENCY_WAIT_SECONDS,
+                 max_response_bytes: int = IDEMPOTENCY_MAX_RESPONSE_BYTES):
+        self.app = app
+        self.store = store
+        self.service = service
+        self.methods = frozenset(methods)
+        self.cache = cache if cache is not None else ResponseCache()
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        self.wait_seconds = wait_seconds
+        self.max_response_bytes = max_response_bytes
+        # Keys this worker is claiming or running; duplicates wait on the event
+        self._inflight: dict = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in self.methods or not self.store.ready:
+            await self.app(scope, receive, send)
+            return
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        key = headers.get(IDEMPOTENCY_HEADER.lower())
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await _send_error(send, 400, f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters")
+            return
+
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+
+        async def replay_receive():
+            nonlocal body
+            if body is None:
+                return await receive()
+            message, body = {"type": "http.request", "body": body, "more_body": False}, None
+            return message
+
+        digest = key_hash(self.service, headers.get("authorization", ""), headers.get(BRANCH_HEADER.lower(), ""), key)
+        fingerprint = request_fingerprint(scope["method"], scope["path"], scope.get("query_string", b""),
+                                          headers.get("content-type", ""), body)
+        try:
+            await self._handle(scope, replay_receive, send, digest, fingerprint)
+        except _StoreUnavailable as e:
+            logger.warning("idempotency store unavailable, running request unprotected: %s", e.__cause__)
+            requests_total.inc(self.service, "unavailable")
+            await self.app(scope, replay_receive, send)
+
+    async def _handle(self, scope, receive, send, digest: bytes, fingerprint: bytes):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait_seconds
+        poll = 0.05
+        while True:
+            stored = self.cache.get(digest)
+            if stored is None:
+                event = self._inflight.get(digest)
+                if event is not None:
+                    try:
+                        await asyncio.wait_for(event.wait(), max(deadline - loop.time(), 0))
+                    except asyncio.TimeoutError:
+                        break
+                    continue
+
+                event = self._inflight[digest] = asyncio.Event()
+                try:
+                    if await self._store(self.store.claim(digest, fingerprint, self.lock_seconds)):
+                        requests_total.inc(self.service, "executed")
+                        await self._execute(scope, receive, send, digest, fingerprint)
+                        return
+                    stored = await self._store(self.store.fetch(digest))
+                finally:
+                    del self._inflight[digest]
+                    event.set()
+                if stored is None:  # released in the meantime: claim again
+                    continue
+
+            if stored.fingerprint != fingerprint:
+                requests_total.inc(self.service, "mismatch")
+                await _send_error(send, 422, f"{IDEMPOTENCY_HEADER} was already used for a different request")
+                return
+            if stored.status_code is not None:
+                self.cache.put(digest, stored)
+                requests_total.inc(self.service, "replayed")
+                await send({"type": "http.response.start", "status": stored.status_code, "headers": [
+                    *((name.encode("latin-1"), value.encode("latin-1")) for name, value in stored.headers),
+                    (b"idempotent-replayed", b"true"),
+                ]})
+                await send({"type": "http.response.body", "body": stored.body})
+                return
+
+            # Running in another worker: poll until it answers
+            if loop.time() >= deadline:
+                break
+            await asyncio.sleep(min(poll, max(deadline - loop.time(), 0)))
+            poll = min(poll * 2, 0.5)
+
+        requests_total.inc(self.service, "in_progress")
+        await _send_error(send, 409, f"A request with this {IDEMPOTENCY_HEADER} is still in progress",
+                          [(b"retry-after", b"1")])
+
+    async def _execute(self, scope, receive, send, digest: bytes, fingerprint: bytes):
+        start = None
+        chunks: Optional[list] = []
+        size = 0
+
+        async def capture(message):
+            nonlocal start, chunks, size
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body" and chunks is not None:
+                size += len(message.get("body", b""))
+                if size > self.max_response_bytes:
+                    chunks = None
+                else:
+                    chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        except BaseException:
+            await self._release(digest)
+            raise
+
+        if start is None or start["status"] >= 500 or chunks is None:
+            await self._release(digest)
+            return
+        response = StoredResponse(
+            fingerprint, start["status"],
+            [[name.decode("latin-1"), value.decode("latin-1")]
+             for name, value in start.get("headers", []) if name.lower() not in _SKIPPED_HEADERS],
+            b"".join(chunks), time.time() + self.ttl_seconds,
+        )
+        try:
+            await self.store.complete(digest, response, self.ttl_seconds)
+        except Exception as e:
+            logger.warning("could not store idempotent response: %s", e)
+            await self._release(digest)
+            return
+        self.cache.put(digest, response)
+
+    async def _release(self, digest: bytes):
+        try:
+            await self.store.release(digest)
+        except Exception as e:
+            # The claim lapses after lock_seconds and the key can be used again
+            logger.warning("could not release idempotency key: %s", e)
+
+    @staticmethod
+    async def _store(call):
+        try:
+            return await call
+        except Exception as e:
+            raise _StoreUnavailable() from e
+
+
+# Shared per-process instance for the asyncpg services
+idempotency_store = IdempotencyStore()
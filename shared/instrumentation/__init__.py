@@ -0,0 +1,69 @@
+"""
+Shared request/DB instrumentation for the Yaman services - أدوات القياس المشتركة
+
+Usage in a FastAPI app:
+
+    from shared.instrumentation import instrument_app, instrument_asyncpg_connection
+
+    instrument_app(app, "work_order_management")          # middleware + GET /metrics
+    instrument_app(app, "user_management", engine=engine)  # also time SQLAlchemy queries
+    pool = await asyncpg.create_pool(url, init=instrument_asyncpg_connection)
+
+Request profiling (profiling.py) is added as well when PROFILE_TOKEN or
+PROFILE_SAMPLE_RATE is set and pyinstrument is installed.
+"""
+from .db import (
+    QueryTimer,
+    get_query_timer,
+    instrument_asyncpg_connection,
+    instrument_engine,
+    normalize_sql,
+    observe_query,
+    set_default_service,
+)
+from .metrics import Counter, Gauge, Histogram, MetricsRegistry, registry
+from .middleware import MetricsMiddleware
+from .profiling import ProfilingMiddleware, add_profile_routes, profile_store, profiling_enabled
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def instrument_app(app, service: str, engine=None, metrics_path: str = "/metrics"):
+    """Add request timing middleware, a Prometheus /metrics endpoint and, if enabled, request profiling."""
+    from fastapi import Response
+
+    set_default_service(service)
+    app.add_middleware(MetricsMiddleware, service=service, exclude=(metrics_path,))
+    if engine is not None:
+        instrument_engine(engine, service)
+
+    async def metrics():
+        return Response(content=registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    app.add_api_route(metrics_path, metrics, methods=["GET"], include_in_schema=False)
+
+    if profiling_enabled():
+        app.add_middleware(ProfilingMiddleware, service=service)
+        add_profile_routes(app)
+    return app
+
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "MetricsMiddleware",
+    "MetricsRegistry",
+    "ProfilingMiddleware",
+    "QueryTimer",
+    "add_profile_routes",
+    "get_query_timer",
+    "instrument_app",
+    "instrument_asyncpg_connection",
+    "instrument_engine",
+    "normalize_sql",
+    "observe_query",
+    "profile_store",
+    "profiling_enabled",
+    "registry",
+]
@@ -0,0 +1,155 @@
+"""
+Database query timing and slow-query log - قياس زمن الاستعلامات
+
+Every statement is timed into db_query_duration_seconds labelled by the
+normalized SQL's verb and table, and statements slower than SLOW_QUERY_MS are
+logged with their normalized text (literals and parameter lists stripped, so
+one log line pattern per query shape and no customer data in logs).
+
+- SQLAlchemy: instrument_engine(engine) hooks cursor execute events.
+- asyncpg: pass instrument_asyncpg_connection as (or from) the pool `init`
+  hook; it registers a query logger on each connection. Prepared statements
+  bypass asyncpg's query loggers, so callers that run them report through
+  observe_query() directly.
+"""
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import logging
+import os
+import re
+import time
+
+from .metrics import MetricsRegistry, registry as default_registry
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+logger = logging.getLogger("yaman.slow_query")
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w$.])-?\d+(?:\.\d+)?\b")
+_PARAM_LIST = re.compile(r"\(\s*(?:\?|%\([^)]*\)s|%s|\$\d+)(?:\s*,\s*(?:\?|%\([^)]*\)s|%s|\$\d+))*\s*\)")
+_PLACEHOLDER = re.compile(r"%\([^)]*\)s|%s|\$\d+")
+_WHITESPACE = re.compile(r"\s+")
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_TABLE = re.compile(r"\b(?:from|into|update|join)\s+([\w.\"]+)", re.I)
+
+
+# Set by the profiling middleware for the duration of a profiled request
+query_timeline: ContextVar[Optional[List[dict]]] = ContextVar("query_timeline", default=None)
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql: str) -> str:
+    """Collapse a statement to its shape: no literals, one `?` per parameter list."""
+    text = _COMMENT.sub(" ", sql)
+    text = _STRING_LITERAL.sub("?", text)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = _PARAM_LIST.sub("(?)", text)
+    text = _PLACEHOLDER.sub("?", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+@lru_cache(maxsize=2048)
+def _query_labels(normalized: str) -> Tuple[str, str]:
+    parts = normalized.split(" ", 1)
+    verb = parts[0].upper() if parts[0] else "UNKNOWN"
+    if verb == "WITH":
+        # CTE: label by the main statement's verb when it can be found
+        match = re.search(r"\)\s*(SELECT|INSERT|UPDATE|DELETE)\b", normalized, re.I)
+        verb = match.group(1).upper() if match else verb
+    table = _TABLE.search(normalized)
+    return verb, table.group(1).strip('"') if table else ""
+
+
+class QueryTimer:
+    def __init__(self, service: str, registry: MetricsRegistry = default_registry,
+                 slow_query_ms: float = SLOW_QUERY_MS):
+        self.service = service
+        self.slow_query_ms = slow_query_ms
+        self.duration = registry.histogram(
+            "db_query_duration_seconds", "Database statement latency by verb and table",
+            ("service", "verb", "table"),
+        )
+        self.errors = registry.counter(
+            "db_query_errors_total", "Database statements that raised",
+            ("service", "verb", "table"),
+        )
+        self.slow = registry.counter(
+            "db_slow_queries_total", "Database statements slower than SLOW_QUERY_MS",
+            ("service", "verb", "table"),
+        )
+
+    def observe(self, sql: str, elapsed: float, error: Optional[BaseException] = None):
+        normalized = normalize_sql(sql)
+        verb, table = _query_labels(normalized)
+        self.duration.observe(elapsed, self.service, verb, table)
+        if error is not None:
+            self.errors.inc(self.service, verb, table)
+        elapsed_ms = elapsed * 1000
+        timeline = query_timeline.get()
+        if timeline is not None:
+            timeline.append({
+                "finished_at": time.perf_counter(),
+                "duration_ms": round(elapsed_ms, 3),
+                "sql": normalized,
+                "error": type(error).__name__ if error is not None else None,
+            })
+        if elapsed_ms >= self.slow_query_ms:
+            self.slow.inc(self.service, verb, table)
+            logger.warning("slow query %.1fms [%s]: %s", elapsed_ms, self.service, normalized)
+
+
+_timers = {}
+_default_service = "app"
+
+
+def get_query_timer(service: Optional[str] = None) -> QueryTimer:
+    service = service or _default_service
+    timer = _timers.get(service)
+    if timer is None:
+        timer = _timers[service] = QueryTimer(service)
+    return timer
+
+
+def set_default_service(service: str):
+    global _default_service
+    _default_service = service
+
+
+def observe_query(sql: str, elapsed: float, error: Optional[BaseException] = None, service: Optional[str] = None):
+    get_query_timer(service).observe(sql, elapsed, error)
+
+
+def instrument_engine(engine, service: Optional[str] = None):
+    """Time every cursor execution on a SQLAlchemy engine."""
+    from sqlalchemy import event
+
+    timer = get_query_timer(service)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        timer.observe(statement, time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        stack = context.connection.info.get("query_start") if context.connection is not None else None
+        if stack:
+            timer.observe(context.statement or "", time.perf_counter() - stack.pop(), context.original_exception)
+
+    return engine
+
+
+async def instrument_asyncpg_connection(conn, service: Optional[str] = None):
+    """asyncpg pool `init` hook: time every query run through this connection."""
+    timer = get_query_timer(service)
+
+    def _log(record):
+        timer.observe(record.query, record.elapsed, record.exception)
+
+    conn.add_query_logger(_log)
@@ -0,0 +1,64 @@
+"""
+ASGI request timing middleware - قياس زمن الطلبات
+
+Records a latency histogram and a status counter per route template (e.g.
+/inspections/{inspection_id}, never the raw path, to keep label cardinality
+bounded) and an in-flight gauge per method. WebSocket and lifespan scopes are
+passed through untouched.
+"""
+import time
+
+from .metrics import MetricsRegistry, registry as default_registry
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _route_template(scope) -> str:
+    # FastAPI stores the matched APIRoute/Mount on the scope during routing
+    route = scope.get("route")
+    path = getattr(route, "path_format", None) or getattr(route, "path", None)
+    return path or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    def __init__(self, app, service: str, registry: MetricsRegistry = default_registry, exclude=("/metrics",)):
+        self.app = app
+        self.service = service
+        self.exclude = frozenset(exclude)
+        self.duration = registry.histogram(
+            "http_request_duration_seconds", "HTTP request latency by route",
+            ("service", "method", "route"),
+        )
+        self.requests = registry.counter(
+            "http_requests_total", "HTTP responses by route and status code",
+            ("service", "method", "route", "status"),
+        )
+        self.in_flight = registry.gauge(
+            "http_requests_in_flight", "HTTP requests currently being handled",
+            ("service", "method"),
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.in_flight.inc(self.service, method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.in_flight.dec(self.service, method)
+            route = _route_template(scope)
+            self.duration.observe(elapsed, self.service, method, route)
+            self.requests.inc(self.service, method, route, str(status))
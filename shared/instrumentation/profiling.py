@@ -0,0 +1,192 @@
+"""
+Request-scoped sampling profiler - تحليل أداء الطلبات
+
+Opt-in: the middleware is only installed when PROFILE_TOKEN is set or
+PROFILE_SAMPLE_RATE > 0 and pyinstrument is importable, so a disabled service
+pays nothing. A request is profiled when it carries
+`X-Profile: <PROFILE_TOKEN>` or is picked by the sample rate. The result
+(speedscope JSON, a text call tree and the request's query timeline) is kept in
+a bounded in-memory ring and, if PROFILE_DIR is set, written to disk.
+
+Sync endpoints run in the threadpool and show up as awaited time on the event
+loop; the query timeline still shows where their time went in the database.
+
+Endpoints (all require the X-Profile token):
+    GET /debug/profiles                  recent profiles
+    GET /debug/profiles/{id}             speedscope JSON (open at https://www.speedscope.app)
+    GET /debug/profiles/{id}/queries     query timeline
+    GET /debug/profiles/{id}/text        call tree as text
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import hmac
+import os
+import random
+import time
+import uuid
+
+from .db import query_timeline
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import ConsoleRenderer, SpeedscopeRenderer
+except ImportError:  # optional dependency
+    Profiler = None
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))  # seconds between samples
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "")
+
+PROFILE_HEADER = b"x-profile"
+
+
+def profiling_enabled() -> bool:
+    return Profiler is not None and bool(PROFILE_TOKEN or PROFILE_SAMPLE_RATE > 0)
+
+
+def token_matches(token: Optional[str]) -> bool:
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+class ProfileStore:
+    def __init__(self, keep: int = PROFILE_KEEP, directory: str = PROFILE_DIR):
+        self.keep = keep
+        self.directory = directory
+        self._profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def add(self, profile: Dict[str, Any]):
+        self._profiles[profile["id"]] = profile
+        while len(self._profiles) > self.keep:
+            self._profiles.popitem(last=False)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{profile['id']}.speedscope.json")
+            with open(path, "w") as out:
+                out.write(profile["speedscope"])
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        return self._profiles.get(profile_id)
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        keys = ("id", "service", "method", "path", "route", "status", "started_at", "duration_ms", "query_count", "query_ms")
+        return [{key: p[key] for key in keys} for p in reversed(self._profiles.values())]
+
+
+profile_store = ProfileStore()
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, service: str, store: ProfileStore = profile_store,
+                 sample_rate: float = PROFILE_SAMPLE_RATE, exclude_prefix: str = "/debug/profiles"):
+        self.app = app
+        self.service = service
+        self.store = store
+        self.sample_rate = sample_rate
+        self.exclude_prefix = exclude_prefix
+        self._busy = False
+
+    def _wanted(self, scope) -> bool:
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_prefix):
+            return False
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return token_matches(value.decode("latin-1"))
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        # One sampling profiler per process at a time; overlapping requests run unprofiled
+        if self._busy or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex[:16]
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        self._busy = True
+        timeline: List[dict] = []
+        token = query_timeline.set(timeline)
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+        started_at = time.time()
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            elapsed = time.perf_counter() - started
+            query_timeline.reset(token)
+            self._busy = False
+            self._record(profile_id, scope, status, profiler, started, started_at, elapsed, timeline)
+
+    def _record(self, profile_id, scope, status, profiler, started, started_at, elapsed, timeline):
+        queries = [
+            {
+                "start_ms": round((q["finished_at"] - started) * 1000 - q["duration_ms"], 3),
+                "duration_ms": q["duration_ms"],
+                "sql": q["sql"],
+                "error": q["error"],
+            }
+            for q in timeline
+        ]
+        route = scope.get("route")
+        self.store.add({
+            "id": profile_id,
+            "service": self.service,
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": getattr(route, "path_format", None) or getattr(route, "path", None),
+            "status": status,
+            "started_at": started_at,
+            "duration_ms": round(elapsed * 1000, 3),
+            "query_count": len(queries),
+            "query_ms": round(sum(q["duration_ms"] for q in queries), 3),
+            "queries": queries,
+            "speedscope": profiler.output(SpeedscopeRenderer()),
+            "text": profiler.output(ConsoleRenderer(unicode=True, color=False, show_all=False)),
+        })
+
+
+def add_profile_routes(app, store: ProfileStore = profile_store):
+    from fastapi import Header, HTTPException, Response
+
+    def check(x_profile: Optional[str]):
+        if not token_matches(x_profile):
+            raise HTTPException(status_code=403, detail="Profiling token required")
+
+    def get_profile(profile_id: str) -> Dict[str, Any]:
+        profile = store.get(profile_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return profile
+
+    async def list_profiles(x_profile: Optional[str] = Header(None)):
+        check(x_profile)
+        return store.summaries()
+
+    async def speedscope(profile_id: str, x_profile: Optional[str] = Header(None)):
+        check(x_profile)
+        return Response(content=get_profile(profile_id)["speedscope"], media_type="application/json")
+
+    async def query_timeline_view(profile_id: str, x_profile: Optional[str] = Header(None)):
+        check(x_profile)
+        profile = get_profile(profile_id)
+        return {"id": profile_id, "duration_ms": profile["duration_ms"], "queries": profile["queries"]}
+
+    async def call_tree(profile_id: str, x_profile: Optional[str] = Header(None)):
+        check(x_profile)
+        return Response(content=get_profile(profile_id)["text"], media_type="text/plain; charset=utf-8")
+
+    app.add_api_route("/debug/profiles", list_profiles, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/debug/profiles/{profile_id}", speedscope, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/debug/profiles/{profile_id}/queries", query_timeline_view, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/debug/profiles/{profile_id}/text", call_tree, methods=["GET"], include_in_schema=False)
@@ -0,0 +1,150 @@
+"""
+Document number allocation - ترقيم المستندات (أوامر العمل، الفحوصات، عروض الأسعار)
+
+Numbers look like WO-2025-000123 and come from work_orders.number_counters
+(see 13-number-counters.sql), one row per prefix and year. Each worker reserves
+a block of NUMBER_BLOCK_SIZE numbers with a single-row upsert on its own short
+connection and hands them out from memory, so concurrent inserts never scan
+the document tables and never collide.
+
+The allocators reserve on the default shard. The insert triggers
+(generate_*_number()) reserve on the shard they run on, so every shard
+database numbers within its own range of NUMBER_SHARD_RANGE, chosen by its
+work_orders.number_shard index. check_shard_indexes() refuses a deployment
+where two shards share an index.
+
+Numbers are unique but gap-tolerant: a block that is not used up before the
+worker exits, or a number whose insert rolls back, is simply skipped. They are
+also only roughly ordered across workers, since each works through its own block.
+
+    allocator = NumberAllocator()
+    allocator.bind(pool)                      # at startup (asyncpg services)
+    number = await allocator.next(WORK_ORDER)
+
+    numbers = SyncNumberAllocator(engine)     # SQLAlchemy (app.py)
+    number = numbers.next(INSPECTION)
+
+    check_shard_indexes(await pools.gather(lambda conn: conn.fetchval(SHARD_INDEX_SQL)))
+"""
+from datetime import date
+from typing import Callable, Dict, Mapping, Optional, Tuple
+import asyncio
+import os
+import threading
+
+WORK_ORDER = "WO"
+INSPECTION = "INSP"
+QUOTE = "QUOTE"
+
+NUMBER_BLOCK_SIZE = int(os.getenv("NUMBER_BLOCK_SIZE", "20"))
+
+ALLOCATE_SQL = "SELECT allocate_number_block($1, $2, $3)"
+SHARD_INDEX_SQL = "SELECT number_shard_index()"
+# Numbers per shard, prefix and year; same constant as allocate_number_block()
+NUMBER_SHARD_RANGE = 10_000_000
+
+
+def check_shard_indexes(indexes: Mapping[str, int]):
+    """ValueError unless every shard (name -> number_shard_index()) numbers in its own range."""
+    owners: Dict[int, str] = {}
+    for shard, index in indexes.items():
+        if index in owners:
+            raise ValueError(
+                f"shards {owners[index]!r} and {shard!r} both use number range {index}; "
+                "set a distinct work_orders.number_shard.shard_index on each shard"
+            )
+        owners[index] = shard
+
+
+def format_number(prefix: str, year: int, value: int) -> str:
+    """Same format as format_document_number() in SQL."""
+    return f"{prefix}-{year}-{value:06d}"
+
+
+class _Blocks:
+    """In-memory reserved ranges per (prefix, year): [next, end)."""
+
+    def __init__(self):
+        self._ranges: Dict[Tuple[str, int], list] = {}
+
+    def take(self, key: Tuple[str, int]) -> Optional[int]:
+        block = self._ranges.get(key)
+        if block is None or block[0] >= block[1]:
+            return None
+        value = block[0]
+        block[0] += 1
+        return value
+
+    def put(self, key: Tuple[str, int], start: int, size: int):
+        # Blocks of earlier years are never used again
+        for stale in [k for k in self._ranges if k[0] == key[0] and k[1] < key[1]]:
+            del self._ranges[stale]
+        self._ranges[key] = [start, start + size]
+
+
+class NumberAllocator:
+    """asyncpg allocator; one per process, bound to the service's pool."""
+
+    def __init__(self, block_size: int = NUMBER_BLOCK_SIZE, today: Callable[[], date] = date.today):
+        self.block_size = block_size
+        self.today = today
+        self.pool = None
+        self._blocks = _Blocks()
+        self._locks: Dict[Tuple[str, int], asyncio.Lock] = {}
+
+    def bind(self, pool):
+        self.pool = pool
+
+    async def next(self, prefix: str, conn=None) -> str:
+        """Next number for prefix; `conn` is only used when no pool is bound."""
+        key = (prefix, self.today().year)
+        value = self._blocks.take(key)
+        if value is None:
+            lock = self._locks.setdefault(key, asyncio.Lock())
+            async with lock:
+                value = self._blocks.take(key)
+                if value is None:
+                    start = await self._reserve(key, conn)
+                    self._blocks.put(key, start + 1, self.block_size - 1)
+                    value = start
+        return format_number(prefix, key[1], value)
+
+    async def _reserve(self, key: Tuple[str, int], conn) -> int:
+        if self.pool is not None:
+            # Own short transaction: the counter row is locked only for the upsert
+            async with self.pool.acquire() as pool_conn:
+                return await pool_conn.fetchval(ALLOCATE_SQL, key[0], key[1], self.block_size)
+        if conn is None:
+            raise RuntimeError("NumberAllocator is not bound to a pool and no connection was given")
+        return await conn.fetchval(ALLOCATE_SQL, key[0], key[1], self.block_size)
+
+
+class SyncNumberAllocator:
+    """SQLAlchemy allocator for the synchronous app; thread-safe."""
+
+    def __init__(self, engine, block_size: int = NUMBER_BLOCK_SIZE, today: Callable[[], date] = date.today):
+        self.engine = engine
+        self.block_size = block_size
+        self.today = today
+        self._blocks = _Blocks()
+        self._lock = threading.Lock()
+
+    def next(self, prefix: str) -> str:
+        from sqlalchemy import text
+
+        key = (prefix, self.today().year)
+        with self._lock:
+            value = self._blocks.take(key)
+            if value is None:
+                with self.engine.begin() as conn:
+                    start = conn.execute(
+                        text("SELECT allocate_number_block(:prefix, :year, :size)"),
+                        {"prefix": key[0], "year": key[1], "size": self.block_size},
+                    ).scalar_one()
+                self._blocks.put(key, start + 1, self.block_size - 1)
+                value = start
+        return format_number(prefix, key[1], value)
+
+
+# Shared per-process instance for the asyncpg services
+number_allocator = NumberAllocator()